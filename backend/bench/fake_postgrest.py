@@ -0,0 +1,218 @@
+"""
+POSTGREST В ПАМЯТИ ПРОЦЕССА ДЛЯ ЗАМЕРОВ (БЕЗ SUPABASE И СЕТИ)
+
+Подключается к настоящему AsyncDatabase как HTTP-транспорт, поэтому замер включает
+построение запросов postgrest-py и разбор JSON. Поддержано только то, что делает бот:
+фильтры eq/gt/lt/in, order, limit, upsert по on_conflict, delete, count=exact и нужные RPC.
+"""
+import asyncio
+import itertools
+import json
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from config.matrix import WORKSHOPS
+
+# Колонки, по которым таблицы бота делают upsert
+UNIQUE_KEYS = {
+    'users': 'telegram_id',
+    'requests': 'idempotency_key',
+    'request_sessions': 'telegram_id',
+    'nonconformances': 'id'
+}
+RESERVED_PARAMS = ('select', 'order', 'limit', 'offset', 'on_conflict')
+
+def _compare(value, operator: str, operand: str) -> bool:
+    if value is None:
+        return operator == 'is' and operand == 'null'
+    if operator == 'in':
+        return str(value) in operand.strip('()').split(',')
+    if operator == 'eq':
+        return str(value).lower() == operand.lower() if isinstance(value, bool) else str(value) == operand
+    if isinstance(value, (int, float)):
+        operand = type(value)(operand)
+    if operator == 'gt':
+        return value > operand
+    if operator == 'lt':
+        return value < operand
+    if operator == 'gte':
+        return value >= operand
+    if operator == 'lte':
+        return value <= operand
+    raise ValueError(f"Unsupported operator {operator}")
+
+class FakePostgrest:
+    """Таблицы бота в памяти и счетчик запросов к «БД»"""
+
+    def __init__(self, latency: float = 0.0):
+        # latency - имитация сетевой задержки одного запроса к PostgREST
+        self.latency = latency
+        self.tables = {name: {} for name in ('users', 'requests', 'request_sessions', 'request_stats', 'nonconformances')}
+        self.calls = Counter()
+        self._clock = itertools.count()
+        self._epoch = datetime.now(timezone.utc)
+
+    def transport(self) -> httpx.MockTransport:
+        """HTTP-транспорт для AsyncDatabase(transport=...)"""
+        return httpx.MockTransport(self.handle)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _now(self) -> str:
+        # Строго возрастающее время: порядок строк как в БД
+        return (self._epoch + timedelta(microseconds=next(self._clock))).isoformat()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.split('/rest/v1', 1)[-1]
+        self.calls[f"{request.method} {path}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        body = json.loads(request.content) if request.content else None
+        if path.startswith('/rpc/'):
+            handler = getattr(self, f"rpc_{path[5:]}", None)
+            if handler is None:
+                return httpx.Response(404, json={'code': 'PGRST202', 'message': f"Unknown function {path[5:]}"})
+            return httpx.Response(200, json=handler(**body))
+
+        table = path.strip('/')
+        if table not in self.tables:
+            return httpx.Response(404, json={'code': '42P01', 'message': f"Unknown table {table}"})
+        params = request.url.params
+        prefer = request.headers.get('prefer', '')
+
+        if request.method == 'GET':
+            rows = self._select(table, params)
+            headers = {}
+            if 'count=exact' in prefer:
+                total = len(self._filter(table, params))
+                headers['content-range'] = f"0-{max(len(rows) - 1, 0)}/{total}"
+            return httpx.Response(200, json=rows, headers=headers)
+        if request.method == 'POST':
+            rows = self._upsert(table, body if isinstance(body, list) else [body], params.get('on_conflict'),
+                                ignore='resolution=ignore-duplicates' in prefer)
+        elif request.method == 'PATCH':
+            rows = self._filter(table, params)
+            for row in rows:
+                row.update(body)
+        elif request.method == 'DELETE':
+            rows = self._filter(table, params)
+            for row in rows:
+                del self.tables[table][self._key(table, row)]
+        else:
+            return httpx.Response(405, json={'code': 'PGRST000', 'message': request.method})
+
+        if 'return=minimal' in prefer:
+            return httpx.Response(201 if request.method == 'POST' else 204)
+        return httpx.Response(201 if request.method == 'POST' else 200, json=rows)
+
+    def _key(self, table: str, row: dict):
+        return row[UNIQUE_KEYS.get(table, 'id')]
+
+    def _filter(self, table: str, params) -> list:
+        filters = [
+            (column, *value.split('.', 1))
+            for column, value in params.multi_items()
+            if column not in RESERVED_PARAMS
+        ]
+        return [
+            row for row in self.tables[table].values()
+            if all(_compare(row.get(column), operator, operand) for column, operator, operand in filters)
+        ]
+
+    def _select(self, table: str, params) -> list:
+        rows = self._filter(table, params)
+        for order in reversed(params.get_list('order')):
+            column, _, direction = order.partition('.')
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith('desc'))
+        if 'limit' in params:
+            rows = rows[:int(params['limit'])]
+        columns = params.get('select', '*')
+        if columns != '*':
+            rows = [{column: row.get(column) for column in columns.split(',')} for row in rows]
+        return rows
+
+    def _upsert(self, table: str, rows: list, on_conflict: str, ignore: bool) -> list:
+        stored = self.tables[table]
+        written = []
+        for row in rows:
+            key = row.get(on_conflict or UNIQUE_KEYS.get(table, 'id'))
+            existing = stored.get(key) if key is not None else None
+            if existing is not None:
+                if ignore:
+                    # Как ON CONFLICT DO NOTHING: повтор не возвращается
+                    continue
+                existing.update(row)
+                existing['updated_at'] = self._now()
+                written.append(existing)
+                continue
+            now = self._now()
+            new = {'id': str(uuid.uuid4()), 'created_at': now, 'updated_at': now, **row}
+            if table == 'users':
+                new.setdefault('role', 'master')
+            if table == 'requests':
+                self._count_stats(new, 1)
+            stored[self._key(table, new)] = new
+            written.append(new)
+        return written
+
+    def _count_stats(self, row: dict, delta: int):
+        # То, что в БД делает триггер update_request_stats
+        key = (row['workshop'], row['product_type'], row.get('status') or 'planned')
+        stats = self.tables['request_stats'].setdefault(key, {
+            'id': key, 'workshop': key[0], 'product_type': key[1], 'status': key[2], 'total': 0
+        })
+        stats['total'] += delta
+
+    def add_inspectors(self, per_workshop: int = 1, first_telegram_id: int = 900000):
+        """Завести контролеров на каждый участок, чтобы работала рассылка уведомлений"""
+        telegram_ids = itertools.count(first_telegram_id)
+        for workshop in WORKSHOPS:
+            for _ in range(per_workshop):
+                self._upsert('users', [{
+                    'telegram_id': next(telegram_ids),
+                    'full_name': 'Контролер',
+                    'workshop': workshop,
+                    'role': 'inspector'
+                }], 'telegram_id', ignore=False)
+
+    # RPC (имена и параметры как у функций в database/init.sql)
+
+    def rpc_purge_stale_sessions(self, max_age_seconds: int) -> int:
+        threshold = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)).isoformat()
+        stale = [key for key, row in self.tables['request_sessions'].items() if row['updated_at'] < threshold]
+        for key in stale:
+            del self.tables['request_sessions'][key]
+        return len(stale)
+
+    def rpc_get_master_requests(self, p_telegram_id, p_cursor_created_at=None, p_cursor_id=None,
+                                p_direction='older', p_limit=5) -> list:
+        user = self.tables['users'].get(p_telegram_id)
+        if user is None:
+            return []
+        rows = sorted(
+            (row for row in self.tables['requests'].values() if row['master_id'] == user['id']),
+            key=lambda row: (row['created_at'], row['id']),
+            reverse=True
+        )
+        if p_cursor_created_at is not None:
+            cursor = (datetime.fromisoformat(p_cursor_created_at).isoformat(), p_cursor_id)
+            if p_direction == 'newer':
+                rows = [row for row in rows if (row['created_at'], row['id']) > cursor][-p_limit:]
+                return rows
+            rows = [row for row in rows if (row['created_at'], row['id']) < cursor]
+        return rows[:p_limit]
+
+    def rpc_get_drawing_numbers(self, p_transformer_type, p_workshop, p_product_type,
+                                p_after=None, p_limit=1000) -> list:
+        numbers = sorted({
+            row['drawing_number'] for row in self.tables['requests'].values()
+            if (row['transformer_type'], row['workshop'], row['product_type']) == (p_transformer_type, p_workshop, p_product_type)
+            and (p_after is None or row['drawing_number'] > p_after)
+        })
+        return [{'drawing_number': number} for number in numbers[:p_limit]]
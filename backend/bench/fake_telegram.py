@@ -0,0 +1,79 @@
+"""
+ЛОКАЛЬНАЯ ЗАГЛУШКА TELEGRAM BOT API ДЛЯ ЗАМЕРОВ (БЕЗ СЕТИ)
+"""
+import asyncio
+import itertools
+import json
+
+from telegram.request import BaseRequest
+
+class FakeTelegram(BaseRequest):
+    """Отвечает на вызовы Bot API из памяти; getUpdates раздает заранее подготовленные обновления"""
+
+    def __init__(self, latency: float = 0.0):
+        # latency - имитация сетевой задержки одного вызова Bot API
+        self.latency = latency
+        self.pending = []
+        self.sent = 0
+        self.calls = {}
+        self.all_sent = asyncio.Event()
+        self.expected = 0
+        self._message_ids = itertools.count(1)
+
+    def feed(self, updates: list):
+        """Подготовить обновления для getUpdates и ждать столько же ответов бота"""
+        self.pending.extend(updates)
+        self.expected += len(updates)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'OTK', 'username': 'otk_bot'}
+        elif name == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            limit = int(params.get('limit') or 100)
+            self.pending = [u for u in self.pending if u['update_id'] >= offset]
+            result = self.pending[:limit]
+            if not result:
+                # Имитация long polling без новых обновлений
+                await asyncio.sleep(0.01)
+        elif name in ('sendMessage', 'sendDocument', 'sendPhoto', 'editMessageText'):
+            chat_id = params.get('chat_id', 1)
+            result = {
+                'message_id': next(self._message_ids),
+                'date': 0,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', '')
+            }
+            self.sent += 1
+            if self.sent >= self.expected:
+                self.all_sent.set()
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def make_message_update(update_id: int, telegram_id: int, text: str) -> dict:
+    """Синтетическое обновление с текстовым сообщением от мастера"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': {'id': telegram_id, 'is_bot': False, 'first_name': f"Мастер {telegram_id}"},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+        }
+    }
@@ -0,0 +1,99 @@
+"""
+ЗАМЕР ПРОПУСКНОЙ СПОСОБНОСТИ: POLLING ПРОТИВ WEBHOOK
+
+Запуск из каталога backend:
+    python -m bench.transport --updates 2000 --users 50 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from bench.fake_postgrest import FakePostgrest
+from bench.fake_telegram import FakeTelegram, make_message_update
+from bot.core import FactoryBot
+from bot.webhook import create_app
+from config import settings
+from database import AsyncDatabase
+
+# Telegram по умолчанию держит до 40 одновременных соединений к webhook
+WEBHOOK_CONNECTIONS = 40
+
+def build_bot(fake: FakeTelegram) -> FactoryBot:
+    """Бот с PostgREST в памяти: /help в БД не ходит, но без ключей Supabase бот не создать"""
+    database = AsyncDatabase(url='http://postgrest.bench', key='bench', transport=FakePostgrest().transport())
+    return FactoryBot('0:bench', request=fake, database=database)
+
+def make_updates(count: int, users: int) -> list:
+    """Команды /help от разных мастеров: обработчик не ходит в БД, меряем только транспорт"""
+    return [make_message_update(i + 1, 1000 + i % users, '/help') for i in range(count)]
+
+async def bench_polling(updates: list, latency: float) -> float:
+    fake = FakeTelegram(latency)
+    fake.feed(updates)
+    application = build_bot(fake).application
+    await application.initialize()
+    await application.start()
+    started = time.perf_counter()
+    await application.updater.start_polling(poll_interval=0, timeout=0)
+    await fake.all_sent.wait()
+    elapsed = time.perf_counter() - started
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return len(updates) / elapsed
+
+async def bench_webhook(updates: list, latency: float) -> float:
+    fake = FakeTelegram(latency)
+    fake.expected = len(updates)
+    bot = build_bot(fake)
+    application = bot.application
+    # Жизненный цикл FastAPI не запускаем: он трогает БД и setWebhook
+    app = create_app(bot)
+    await application.initialize()
+    await application.start()
+
+    connections = asyncio.Semaphore(WEBHOOK_CONNECTIONS)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def deliver(update: dict):
+            async with connections:
+                if latency:
+                    await asyncio.sleep(latency)
+                response = await client.post(
+                    settings.WEBHOOK_PATH,
+                    json=update,
+                    headers={'X-Telegram-Bot-Api-Secret-Token': settings.WEBHOOK_SECRET}
+                )
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(update) for update in updates))
+        await fake.all_sent.wait()
+        elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.shutdown()
+    return len(updates) / elapsed
+
+async def main(args):
+    updates = make_updates(args.updates, args.users)
+    with tempfile.TemporaryDirectory() as directory:
+        settings.OUTBOX_PATH = os.path.join(directory, 'outbox.sqlite3')
+        # Один мастер шлет /help много раз подряд: это не двойные нажатия, склеивать их нельзя
+        settings.DEDUP_MESSAGE_WINDOW = 0
+        polling = await bench_polling(updates, args.latency)
+        webhook = await bench_webhook(updates, args.latency)
+    print(f"updates: {args.updates}, users: {args.users}, Bot API latency: {args.latency * 1000:.0f} ms")
+    print(f"polling: {polling:8.1f} updates/sec")
+    print(f"webhook: {webhook:8.1f} updates/sec")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Polling vs webhook throughput')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,207 @@
+"""
+ЗАМЕР МАСТЕРА ЗАЯВОК ЦЕЛИКОМ: ОТ «➕ НОВАЯ ЗАЯВКА» ДО ЗАПИСИ ЗАЯВКИ В БД
+
+N мастеров одновременно регистрируются и создают заявки через настоящий FactoryBot;
+Telegram и PostgREST заменены заглушками в памяти. Результат сохраняется в JSON,
+чтобы сравнивать версии между собой.
+
+Запуск из каталога backend:
+    python -m bench.wizard --masters 200 --requests 5
+    python -m bench.wizard --masters 200 --requests 5 --compare bench/results/wizard-<версия>.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from telegram import Update
+
+from bench.fake_postgrest import FakePostgrest
+from bench.fake_telegram import FakeTelegram, make_message_update
+from bot.core import FactoryBot
+from bot.keyboards import BUTTON_MY_REQUESTS, BUTTON_NEW_REQUEST
+from config import settings
+from config.matrix import PRODUCTS, TRANSFORMER_TYPES, VALID_SELECTIONS, WORKSHOPS, is_product_number_required
+from database import AsyncDatabase
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+PERCENTILES = (50, 95, 99)
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по ближайшему рангу (values отсортирован)"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def current_version() -> str:
+    """Короткий хэш коммита, иначе 'local'"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+
+class WizardBench:
+    """Синтетические мастера, которые проходят мастер заявки и ждут ответа на каждый шаг"""
+
+    def __init__(self, masters: int, requests: int, db_latency: float, api_latency: float, seed: int):
+        self.masters = masters
+        self.requests = requests
+        self.random = random.Random(seed)
+        self.postgrest = FakePostgrest(db_latency)
+        self.telegram = FakeTelegram(api_latency)
+        self.latencies = {}
+        self.update_ids = iter(range(1, 10 ** 9))
+        self.selections = sorted(VALID_SELECTIONS)
+
+    def build_bot(self):
+        database = AsyncDatabase(url='http://postgrest.bench', key='bench', transport=self.postgrest.transport())
+        self.bot = FactoryBot('0:bench', request=self.telegram, database=database)
+        self.application = self.bot.application
+
+    async def send(self, telegram_id: int, text: str):
+        """Одно сообщение мастера: обработка через тот же планировщик, что и в боте"""
+        session = self.bot.sessions.get(telegram_id)
+        step = session['current_step'] if session is not None else None
+        if text.startswith('/'):
+            handler = text[1:]
+        else:
+            handler = self.bot.dispatcher.resolve(step, text).__name__
+
+        update = Update.de_json(make_message_update(next(self.update_ids), telegram_id, text), self.application.bot)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+        self.latencies.setdefault(handler, []).append(time.perf_counter() - started)
+
+    async def run_master(self, telegram_id: int):
+        await self.send(telegram_id, '/start')
+        await self.send(telegram_id, WORKSHOPS[self.random.choice(list(WORKSHOPS))])
+        for number in range(self.requests):
+            transformer, workshop, product = self.random.choice(self.selections)
+            await self.send(telegram_id, BUTTON_NEW_REQUEST)
+            await self.send(telegram_id, TRANSFORMER_TYPES[transformer])
+            await self.send(telegram_id, WORKSHOPS[workshop])
+            await self.send(telegram_id, PRODUCTS[product])
+            await self.send(telegram_id, f"ТМГ{telegram_id % 1000:03d}.{number:05d}")
+            if is_product_number_required(product):
+                await self.send(telegram_id, str(telegram_id * 100 + number))
+        await self.send(telegram_id, BUTTON_MY_REQUESTS)
+
+    async def run(self) -> dict:
+        self.build_bot()
+        self.postgrest.add_inspectors()
+        await self.application.initialize()
+        await self.bot.on_startup(self.application)
+
+        updates_before = self.telegram.calls.get('sendMessage', 0)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_master(100000 + i) for i in range(self.masters)))
+        elapsed = time.perf_counter() - started
+        # Заявки, еще лежащие в журнале, дописываем сразу, чтобы учесть все запросы к БД
+        while await self.bot.outbox.drain():
+            pass
+        db_calls = dict(self.postgrest.calls)
+
+        await self.bot.on_stop(self.application)
+        await self.bot.on_shutdown(self.application)
+        await self.application.shutdown()
+
+        created = len(self.postgrest.tables['requests'])
+        expected = self.masters * self.requests
+        if created != expected:
+            raise RuntimeError(f"Expected {expected} requests in database, found {created}")
+
+        updates = sum(len(values) for values in self.latencies.values())
+        handlers = {}
+        for handler, values in sorted(self.latencies.items()):
+            values.sort()
+            handlers[handler] = {
+                'count': len(values),
+                **{f"p{p}_ms": round(percentile(values, p) * 1000, 3) for p in PERCENTILES},
+                'max_ms': round(values[-1] * 1000, 3)
+            }
+        return {
+            'version': current_version(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'updates': updates,
+            'requests_created': created,
+            'elapsed_s': round(elapsed, 3),
+            'updates_per_sec': round(updates / elapsed, 1),
+            'db_calls_total': sum(db_calls.values()),
+            'db_calls_per_request': round(sum(db_calls.values()) / created, 3),
+            'bot_api_calls': self.telegram.calls.get('sendMessage', 0) - updates_before,
+            'db_calls': dict(sorted(db_calls.items())),
+            'handlers': handlers
+        }
+
+def print_report(result: dict, baseline: dict = None):
+    def delta(path: tuple) -> str:
+        if baseline is None:
+            return ''
+        old = baseline
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+        new = result
+        for key in path:
+            new = new[key]
+        if not old:
+            return '      (new)'
+        return f" {(new - old) / old * 100:+8.1f}%"
+
+    print(f"version {result['version']}: {result['updates']} updates, {result['requests_created']} requests "
+          f"in {result['elapsed_s']} s")
+    print(f"updates/sec:          {result['updates_per_sec']:10.1f}{delta(('updates_per_sec',))}")
+    print(f"DB calls per request: {result['db_calls_per_request']:10.3f}{delta(('db_calls_per_request',))}")
+    print()
+    print(f"{'handler':36} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for handler, stats in result['handlers'].items():
+        print(f"{handler:36} {stats['count']:7d} {stats['p50_ms']:9.3f} {stats['p95_ms']:9.3f} "
+              f"{stats['p99_ms']:9.3f}{delta(('handlers', handler, 'p95_ms'))}")
+    print()
+    print('DB calls:')
+    for call, count in result['db_calls'].items():
+        print(f"  {call:40} {count:7d}")
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        # Журнал заявок - во временном каталоге, чтобы прогоны не влияли друг на друга
+        settings.OUTBOX_PATH = os.path.join(directory, 'outbox.sqlite3')
+        # Синтетический мастер отвечает мгновенно: одинаковые ответы подряд - не двойное нажатие
+        settings.DEDUP_MESSAGE_WINDOW = 0
+        result = await WizardBench(args.masters, args.requests, args.db_latency, args.api_latency, args.seed).run()
+    result['params'] = {
+        'masters': args.masters,
+        'requests': args.requests,
+        'db_latency': args.db_latency,
+        'api_latency': args.api_latency,
+        'seed': args.seed
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(result, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"wizard-{result['version']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {output}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Full request wizard benchmark with fake Telegram and PostgREST')
+    parser.add_argument('--masters', type=int, default=200, help='concurrent simulated masters')
+    parser.add_argument('--requests', type=int, default=5, help='requests per master')
+    parser.add_argument('--db-latency', type=float, default=0.005, help='PostgREST round trip, seconds')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Bot API round trip, seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='result file (default bench/results/wizard-<git hash>.json)')
+    parser.add_argument('--compare', help='previous result file to compare against')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""
+ПАКЕТНАЯ ПОДАЧА ЗАЯВОК: СПИСОК СТРОК «ЧЕРТЕЖ;НОМЕР» ИЛИ CSV-ФАЙЛ
+"""
+import csv
+import io
+import re
+import uuid
+
+from config.matrix import is_product_number_required
+
+# Разделители между номером чертежа и номером изделия в строке
+_DELIMITERS = ';,\t'
+# Первая строка CSV с такими словами - заголовок, а не данные
+_HEADER_WORDS = ('чертеж', 'чертёж', 'drawing')
+MAX_NUMBER_LENGTH = 100
+
+def decode_document(data: bytes) -> str:
+    """Текст CSV: UTF-8 (в том числе с BOM), иначе Windows-1251 из Excel"""
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+def split_text(text: str) -> list:
+    """Строки вставленного списка: по разделителю, иначе по первому пробелу"""
+    rows = []
+    for line in text.splitlines():
+        delimiter = next((d for d in _DELIMITERS if d in line), None)
+        parts = line.split(delimiter, 1) if delimiter else line.split(None, 1)
+        rows.append(parts)
+    return rows
+
+def split_csv(text: str) -> list:
+    """Строки CSV-файла с автоопределением разделителя"""
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+    rows = list(csv.reader(io.StringIO(text), dialect))
+    if rows and any(word in ' '.join(rows[0]).lower() for word in _HEADER_WORDS):
+        # Заголовок занимает строку 1, чтобы номера строк в ошибках совпадали с файлом
+        rows[0] = []
+    return rows
+
+def validate_rows(rows: list, product_type: str, max_rows: int) -> tuple[list, list]:
+    """Проверить строки; вернуть ([(номер чертежа, номер изделия)], [текст ошибки])"""
+    requires_number = is_product_number_required(product_type)
+    items = []
+    errors = []
+    seen = {}
+
+    for line_number, parts in enumerate(rows, start=1):
+        parts = [re.sub(r'\s+', ' ', part).strip() for part in parts]
+        if not any(parts):
+            continue
+        if len(items) >= max_rows:
+            errors.append(f"Строка {line_number}: больше {max_rows} строк за раз не принимается")
+            break
+
+        drawing_number = parts[0]
+        product_number = parts[1] if len(parts) > 1 and parts[1] else None
+
+        if not drawing_number:
+            errors.append(f"Строка {line_number}: нет номера чертежа")
+        elif requires_number and not product_number:
+            errors.append(f"Строка {line_number}: для этого изделия нужен номер изделия")
+        elif len(drawing_number) > MAX_NUMBER_LENGTH or len(product_number or '') > MAX_NUMBER_LENGTH:
+            errors.append(f"Строка {line_number}: слишком длинный номер")
+        elif (drawing_number, product_number) in seen:
+            errors.append(f"Строка {line_number}: повторяет строку {seen[(drawing_number, product_number)]}")
+        else:
+            seen[(drawing_number, product_number)] = line_number
+            items.append((drawing_number, product_number))
+
+    return items, errors
+
+def item_idempotency_key(session_id: str, drawing_number: str, product_number) -> str:
+    """Ключ строки внутри сессии: повторная отправка того же списка не создаст дубликатов"""
+    return str(uuid.uuid5(uuid.UUID(session_id), f"{drawing_number}|{product_number or ''}"))
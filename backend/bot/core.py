@@ -1,69 +1,282 @@
 import os
+import asyncio
 import logging
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import uuid
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputMediaPhoto,
+    InputTextMessageContent
+)
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    ApplicationHandlerStop,
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler,
+    filters,
+    ContextTypes
+)
+from telegram.request import BaseRequest
 
 from config.matrix import (
     TRANSFORMER_TYPES,
     WORKSHOPS,
     PRODUCTS,
-    get_workshops_for_transformer,
-    get_products_for_workshop,
+    STATUS_ICONS,
+    REQUEST_STATUSES,
     is_product_number_required,
+    is_workshop_available,
+    resolve_label,
+    status_label,
     validate_selection
 )
-from database import db
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from config import settings
+import metrics
+from cache import TTLCache
+from database import get_db
+from instrumentation import SlowUpdateProfiler, start_metrics_server, timed
+from outbox import RequestOutbox
+from reports import export_requests, parse_period, xlsx_available
+from bot.keyboards import (
+    BUTTON_MY_REQUESTS,
+    BUTTON_NEW_REQUEST,
+    BUTTON_NONCONFORMANCES,
+    BUTTON_STATISTICS,
+    BUTTON_INSPECTION_QUEUE,
+    BUTTON_CANCEL,
+    BUTTON_DONE,
+    MAIN_KEYBOARD,
+    INSPECTOR_KEYBOARD,
+    NONCONFORMANCE_KEYBOARD,
+    REGISTRATION_KEYBOARD,
+    TRANSFORMER_KEYBOARD,
+    CANCEL_KEYBOARD,
+    workshops_keyboard,
+    products_keyboard
 )
-logger = logging.getLogger.getLogger(__name__)
+from bot.bulk import decode_document, item_idempotency_key, split_csv, split_text, validate_rows
+from bot.dedup import UpdateDeduplicator
+from bot.dispatcher import ANY_STEP, FREE_TEXT, StepDispatcher
+from bot.drawings import DrawingIndex
+from bot.notifications import Notifier
+from bot.pagination import decode_cursor, encode_cursor
+from bot.photos import ThumbnailCache, photo_ref
+from bot.scheduler import PerUserUpdateProcessor, shard_of
+from bot.sessions import SessionStore
+
+logger = logging.getLogger(__name__)
+
+HANDLER_DURATION = metrics.histogram('bot_handler_duration_seconds', 'Время обработчика обновления')
+HANDLER_ERRORS = metrics.counter('bot_handler_errors_total', 'Исключения в обработчиках обновлений')
+
+# Заявок на одной странице "📋 Мои заявки"
+REQUESTS_PAGE_SIZE = 5
+# Заявок на одной странице очереди контролера
+QUEUE_PAGE_SIZE = 10
+# Кнопки контролера в callback_data: 'it:<код>:<id заявки без дефисов>'
+INSPECTION_ACTIONS = {'c': 'claim', 'a': 'accept', 'r': 'reject'}
+# Несоответствий в списке мастера
+NONCONFORMANCES_PAGE_SIZE = 10
+# Шаги оформления несоответствия
+NONCONFORMANCE_STEPS = ('nc_describing', 'nc_attaching_photos')
 
 class FactoryBot:
-    def __init__(self, token: str):
-        self.application = Application.builder().token(token).build()
+    def __init__(self, token: str, request: BaseRequest = None, database=None):
+        # Профилировщик медленных обновлений включается только явно (PROFILE_SAMPLE_RATE > 0)
+        profiler = None
+        if settings.PROFILE_SAMPLE_RATE > 0:
+            profiler = SlowUpdateProfiler(settings.PROFILE_SLOW_UPDATE, settings.PROFILE_SAMPLE_RATE)
+        builder = (
+            Application.builder()
+            .token(token)
+            .concurrent_updates(PerUserUpdateProcessor(settings.CONCURRENT_UPDATES, profiler=profiler))
+            .post_init(self.on_startup)
+            .post_stop(self.on_stop)
+            .post_shutdown(self.on_shutdown)
+        )
+        if request is not None:
+            # Свой транспорт Bot API (например, заглушка для замеров)
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
+        # БД можно подменить (например, локальной заглушкой для замеров); общий клиент создается только здесь
+        self.db = database if database is not None else get_db()
+        # Процесс BOT_MODE=worker обслуживает только пользователей своей доли (см. bot/shards.py)
+        self.workers = settings.WORKERS if settings.BOT_MODE == 'worker' else 1
+        self.sessions = SessionStore(
+            self.db,
+            ttl=settings.SESSION_TTL,
+            max_size=settings.SESSION_MAX_SIZE,
+            flush_interval=settings.SESSION_FLUSH_INTERVAL,
+            max_age=settings.SESSION_MAX_AGE,
+            sweep_interval=settings.SESSION_SWEEP_INTERVAL,
+            owns=self.owns_user if self.workers > 1 else None
+        )
+        self.outbox = RequestOutbox(
+            self.db,
+            path=settings.OUTBOX_PATH,
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            flush_interval=settings.OUTBOX_FLUSH_INTERVAL,
+            max_backoff=settings.OUTBOX_MAX_BACKOFF
+        )
+        # Новые заявки уходят контролерам участка фоновой рассылкой
+        self.notifier = Notifier(
+            self.application.bot,
+            self.db,
+            # Лимит Telegram общий на бота: делим его между процессами
+            global_rate=settings.NOTIFY_GLOBAL_RATE / self.workers,
+            chat_interval=settings.NOTIFY_CHAT_INTERVAL,
+            digest_window=settings.NOTIFY_DIGEST_WINDOW,
+            inspectors_ttl=settings.INSPECTORS_CACHE_TTL
+        )
+        self.outbox.listeners.append(self.notifier.notify_new_requests)
+        # Подсказки номеров чертежей: загружаются при первом поиске, новые заявки дописываются из outbox
+        self.drawings = DrawingIndex(self.db, limit=settings.DRAWING_SUGGESTIONS, ttl=settings.DRAWING_INDEX_TTL)
+        self.outbox.listeners.append(self.drawings.add)
+        # Миниатюры фото несоответствий для API: скачиваются только по запросу
+        self.thumbnails = ThumbnailCache(
+            self.application.bot,
+            directory=settings.THUMBNAIL_DIR,
+            max_bytes=settings.THUMBNAIL_CACHE_SIZE
+        )
+        # Готовый текст статистики общий для всех, поэтому достаточно одной записи
+        self.stats_cache = TTLCache(1, settings.STATS_CACHE_TTL)
+        self.metrics_server = None
         self.setup_handlers()
+        self.instrument_handlers()
+    
+    def owns_user(self, telegram_id: int) -> bool:
+        """Пользователь закреплен за этим процессом"""
+        return shard_of(telegram_id, self.workers) == settings.WORKER_INDEX
+    
+    async def on_startup(self, application: Application):
+        """Восстановление сессий и запуск фоновых задач"""
+        try:
+            await self.sessions.load()
+        except Exception as e:
+            logger.error("Error restoring sessions: %s", e)
+        self.sessions.start_background()
+        self.outbox.start_background()
+        self.notifier.start_background()
+        # В режимах webhook и worker /metrics отдает FastAPI
+        if settings.BOT_MODE not in ('webhook', 'worker') and settings.METRICS_PORT:
+            self.metrics_server = await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+    
+    async def on_stop(self, application: Application):
+        """Дописать заявки и разослать уведомления, пока клиент Bot API еще открыт"""
+        await self.outbox.stop()
+        await self.notifier.flush(settings.NOTIFY_SHUTDOWN_TIMEOUT)
+        await self.notifier.stop()
+
+    async def on_shutdown(self, application: Application):
+        """Освобождение ресурсов при остановке бота"""
+        await self.sessions.stop()
+        await self.db.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
     
     def setup_handlers(self):
         """Настройка обработчиков команд"""
+        # Повторы отсекаются до всех остальных обработчиков (группа -1)
+        self.deduplicator = UpdateDeduplicator(
+            max_size=settings.DEDUP_MAX_SIZE,
+            update_ttl=settings.DEDUP_UPDATE_TTL,
+            message_window=settings.DEDUP_MESSAGE_WINDOW
+        )
+        self.application.add_handler(TypeHandler(Update, self.deduplicator), group=-1)
+        
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(MessageHandler(filters.Text(["📋 Мои заявки"]), self.show_my_requests))
-        self.application.add_handler(MessageHandler(filters.Text(["➕ Новая заявка"]), self.start_new_request))
-        self.application.add_handler(MessageHandler(filters.Text(["❌ Отмена"]), self.cancel_request))
+        self.application.add_handler(CommandHandler("queue", self.show_inspection_queue))
+        self.application.add_handler(CommandHandler("export", self.export_command))
+        self.application.add_handler(CallbackQueryHandler(self.show_my_requests_page, pattern=r'^rq:'))
+        self.application.add_handler(CallbackQueryHandler(self.show_inspection_queue_page, pattern=r'^iq:'))
+        self.application.add_handler(CallbackQueryHandler(self.handle_inspection_action, pattern=r'^it:'))
+        self.application.add_handler(CallbackQueryHandler(self.start_nonconformance, pattern=r'^nc:'))
+        self.application.add_handler(CallbackQueryHandler(self.send_nonconformance_photos, pattern=r'^np:'))
+        
+        # Все текстовые сообщения идут через диспетчер по (шаг мастера, текст)
+        self.dispatcher = StepDispatcher(self.sessions, fallback=self.handle_unknown)
+        self.setup_routes(self.dispatcher)
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.dispatcher))
+        
+        # CSV-файл со списком чертежей для пакетной подачи
+        self.application.add_handler(MessageHandler(
+            filters.Document.FileExtension('csv') | filters.Document.MimeType('text/csv'),
+            self.handle_bulk_document
+        ))
         
-        # Обработчики создания заявки
-        self.application.add_handler(MessageHandler(filters.Text(list(TRANSFORMER_TYPES.values())), self.handle_transformer_selection))
-        self.application.add_handler(MessageHandler(filters.Text(list(WORKSHOPS.values())), self.handle_workshop_selection_request))
-        self.application.add_handler(MessageHandler(filters.Text(list(PRODUCTS.values())), self.handle_product_selection))
+        # Фото несоответствия: в сессию попадает только ссылка file_id
+        self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_nonconformance_photo))
+        
+        # Подсказки номера чертежа: «@бот начало номера» в поле ввода
+        self.application.add_handler(InlineQueryHandler(self.handle_drawing_query))
+    
+    def instrument_handlers(self):
+        """Замер времени и ошибок каждого обработчика; маршруты диспетчера замеряются по отдельности"""
+        def instrument(callback):
+            # ApplicationHandlerStop - штатная остановка (отсев повторов), а не ошибка
+            return timed(callback, HANDLER_DURATION, HANDLER_ERRORS, 'handler', ignore=(ApplicationHandlerStop,))
         
-        # Обработчик выбора участка при регистрации
-        self.application.add_handler(MessageHandler(filters.Text(list(WORKSHOPS.values())), self.handle_workshop_selection))
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                if handler.callback is not self.dispatcher:
+                    handler.callback = instrument(handler.callback)
+        self.dispatcher.wrap(instrument)
+    
+    def setup_routes(self, dispatcher: StepDispatcher):
+        """Таблица переходов мастера по шагам"""
+        # Главное меню доступно на любом шаге
+        dispatcher.route([ANY_STEP], [BUTTON_MY_REQUESTS], self.show_my_requests)
+        dispatcher.route([ANY_STEP], [BUTTON_NEW_REQUEST], self.start_new_request)
+        dispatcher.route([ANY_STEP], [BUTTON_CANCEL], self.cancel_request)
+        dispatcher.route([ANY_STEP], [BUTTON_STATISTICS], self.show_statistics)
+        dispatcher.route([ANY_STEP], [BUTTON_INSPECTION_QUEUE], self.show_inspection_queue)
+        dispatcher.route([ANY_STEP], [BUTTON_NONCONFORMANCES], self.show_nonconformances)
+        
+        # Участок при регистрации выбирается только после /start; без сессии кнопка участка - со старого экрана
+        dispatcher.route(['registering'], WORKSHOPS.values(), self.handle_workshop_selection)
+        dispatcher.route([None], WORKSHOPS.values(), self.handle_stale_selection)
+        
+        # Шаги создания заявки
+        dispatcher.route(
+            [None, 'selecting_transformer', 'selecting_workshop', 'selecting_product'],
+            TRANSFORMER_TYPES.values(),
+            self.handle_transformer_selection
+        )
+        dispatcher.route(['selecting_workshop'], WORKSHOPS.values(), self.handle_workshop_selection_request)
+        dispatcher.route(['selecting_product'], PRODUCTS.values(), self.handle_product_selection)
+        dispatcher.route(['entering_drawing_number'], [FREE_TEXT], self.handle_drawing_number)
+        dispatcher.route(['entering_product_number'], [FREE_TEXT], self.handle_product_number)
         
-        # Обработчик неизвестных сообщений
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_unknown))
+        # Шаги оформления несоответствия
+        dispatcher.route(NONCONFORMANCE_STEPS, [FREE_TEXT], self.handle_nonconformance_description)
+        dispatcher.route(NONCONFORMANCE_STEPS, [BUTTON_DONE], self.finish_nonconformance)
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        logger.info(f"User {user.id} started the bot")
+        logger.info("User %s started the bot", user.id)
         
-        # Создаем клавиатуру с участками
-        workshop_buttons = [[KeyboardButton(workshop)] for workshop in WORKSHOPS.values()]
-        reply_markup = ReplyKeyboardMarkup(workshop_buttons, resize_keyboard=True, one_time_keyboard=True)
+        # Незавершенная заявка сбрасывается: следующий выбор участка - это регистрация
+        self.sessions.start(user.id, current_step='registering')
         
         await update.message.reply_html(
             rf"Привет, {user.mention_html()}! 👋"
             f"\n\nЯ бот для управления заявками ОТК на заводе трансформаторов."
             f"\n\nВыбери свой участок:",
-            reply_markup=reply_markup
+            reply_markup=REGISTRATION_KEYBOARD
         )
     
     async def handle_workshop_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик выбора участка при регистрации"""
-        workshop = update.message.text
+        workshop_name = update.message.text
+        workshop = resolve_label('workshop', workshop_name)
         user = update.effective_user
         
         try:
@@ -74,40 +287,47 @@ class FactoryBot:
                 'full_name': user.full_name,
                 'workshop': workshop
             }
-            db.create_user(user_data)
-            
-            logger.info(f"User {user.id} registered for workshop {workshop}")
+            response = await self.db.create_user(user_data)
             
-            # Основная клавиатура
-            main_keyboard = ReplyKeyboardMarkup([
-                ["📋 Мои заявки", "➕ Новая заявка"],
-                ["⚠️ Несоответствия", "📊 Статистика"]
-            ], resize_keyboard=True)
+            logger.info("User %s registered for workshop %s", user.id, workshop)
+            self.sessions.finish(user.id)
+            # Заявки, поданные до регистрации, теперь есть кому приписать
+            await self.outbox.release_master(user.id)
             
+            # Роль назначается в БД и при повторной регистрации сохраняется
+            is_inspector = bool(response.data) and response.data[0].get('role') in ('inspector', 'admin')
             await update.message.reply_text(
-                f"✅ Отлично! Ты привязан к участку: {workshop}\n\n"
+                f"✅ Отлично! Ты привязан к участку: {workshop_name}\n\n"
                 f"Теперь можешь создавать заявки на приемку и отслеживать их статус.",
-                reply_markup=main_keyboard
+                reply_markup=INSPECTOR_KEYBOARD if is_inspector else MAIN_KEYBOARD
             )
             
         except Exception as e:
-            logger.error(f"Error saving user: {e}")
+            logger.error("Error saving user: %s", e)
             await update.message.reply_text(
                 "❌ Произошла ошибка при сохранении. Попробуй еще раз.",
-                reply_markup=ReplyKeyboardMarkup([[w] for w in WORKSHOPS.values()], resize_keyboard=True)
+                reply_markup=REGISTRATION_KEYBOARD
             )
     
+    async def handle_stale_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка участка без сессии: сессия истекла или потерялась, участок молча не меняем"""
+        await update.message.reply_text(
+            "⌛ Сессия устарела. Чтобы создать заявку, нажми «➕ Новая заявка», "
+            "а чтобы сменить участок - /start.",
+            reply_markup=self.main_keyboard(update.effective_user.id)
+        )
+    
     async def start_new_request(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало создания новой заявки"""
-        # Создаем клавиатуру с типами трансформаторов
-        transformer_buttons = [[KeyboardButton(t_type)] for t_type in TRANSFORMER_TYPES.values()]
-        transformer_buttons.append(["❌ Отмена"])
-        reply_markup = ReplyKeyboardMarkup(transformer_buttons, resize_keyboard=True, one_time_keyboard=True)
+        # Профиль попадает в кэш, и при подаче заявки проверка регистрации не ходит в БД
+        if not await self.check_registered(update, update.effective_user.id):
+            return
+        self.sessions.start(update.effective_user.id, current_step='selecting_transformer')
         
         await update.message.reply_text(
             "🛠️ Создаем новую заявку!\n\n"
             "Выбери тип трансформатора:",
-            reply_markup=reply_markup
+            reply_markup=TRANSFORMER_KEYBOARD
         )
     
     async def handle_transformer_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -116,26 +336,22 @@ class FactoryBot:
         user = update.effective_user
         
         # Находим ключ типа по названию
-        transformer_type = next(key for key, value in TRANSFORMER_TYPES.items() if value == transformer_type_name)
-        
-        # Получаем доступные участки для этого типа
-        available_workshops = get_workshops_for_transformer(transformer_type)
-        workshop_buttons = [[KeyboardButton(WORKSHOPS[ws])] for ws in available_workshops]
-        workshop_buttons.append(["❌ Отмена"])
-        
-        reply_markup = ReplyKeyboardMarkup(workshop_buttons, resize_keyboard=True, one_time_keyboard=True)
+        transformer_type = resolve_label('transformer', transformer_type_name)
+        if transformer_type is None:
+            await update.message.reply_text("❌ Неизвестный тип трансформатора. Выбери его кнопкой.")
+            return
         
         # Сохраняем в сессию
-        db.save_session({
-            'telegram_id': user.id,
-            'transformer_type': transformer_type,
-            'current_step': 'selecting_workshop'
-        })
+        self.sessions.start(
+            user.id,
+            transformer_type=transformer_type,
+            current_step='selecting_workshop'
+        )
         
         await update.message.reply_text(
             f"✅ Выбран тип: {transformer_type_name}\n\n"
             f"Теперь выбери участок:",
-            reply_markup=reply_markup
+            reply_markup=workshops_keyboard(transformer_type)
         )
     
     async def handle_workshop_selection_request(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -144,36 +360,28 @@ class FactoryBot:
         user = update.effective_user
         
         # Получаем сессию пользователя
-        session_response = db.get_session(user.id)
-        if not session_response.data:
+        session = self.sessions.get(user.id)
+        if session is None:
             await update.message.reply_text("❌ Сессия устарела. Начни заново.")
             return
         
-        session = session_response.data[0]
-        transformer_type = session['transformer_type']
-        
         # Находим ключ участка по названию
-        workshop = next(key for key, value in WORKSHOPS.items() if value == workshop_name)
-        
-        # Получаем доступные изделия для этого участка
-        available_products = get_products_for_workshop(workshop)
-        product_buttons = [[KeyboardButton(PRODUCTS[prod])] for prod in available_products]
-        product_buttons.append(["❌ Отмена"])
-        
-        reply_markup = ReplyKeyboardMarkup(product_buttons, resize_keyboard=True, one_time_keyboard=True)
+        workshop = resolve_label('workshop', workshop_name)
+        if workshop is None or not is_workshop_available(session['transformer_type'], workshop):
+            await update.message.reply_text("❌ Этот участок недоступен для выбранного типа трансформатора")
+            return
         
         # Обновляем сессию
-        db.save_session({
-            'telegram_id': user.id,
-            'transformer_type': transformer_type,
-            'workshop': workshop,
-            'current_step': 'selecting_product'
-        })
+        self.sessions.update(
+            user.id,
+            workshop=workshop,
+            current_step='selecting_product'
+        )
         
         await update.message.reply_text(
             f"✅ Выбран участок: {workshop_name}\n\n"
             f"Теперь выбери изделие:",
-            reply_markup=reply_markup
+            reply_markup=products_keyboard(workshop)
         )
     
     async def handle_product_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -182,49 +390,48 @@ class FactoryBot:
         user = update.effective_user
         
         # Получаем сессию пользователя
-        session_response = db.get_session(user.id)
-        if not session_response.data:
+        session = self.sessions.get(user.id)
+        if session is None:
             await update.message.reply_text("❌ Сессия устарела. Начни заново.")
             return
         
-        session = session_response.data[0]
-        
-        # Находим ключ изделия по названию
-        product = next(key for key, value in PRODUCTS.items() if value == product_name)
+        # Находим ключ изделия по названию и проверяем сочетание
+        product = resolve_label('product', product_name)
+        is_valid, error_message = validate_selection(session['transformer_type'], session['workshop'], product)
+        if not is_valid:
+            await update.message.reply_text(error_message)
+            return
         
         # Обновляем сессию
-        db.save_session({
-            'telegram_id': user.id,
-            'transformer_type': session['transformer_type'],
-            'workshop': session['workshop'],
-            'product_type': product,
-            'current_step': 'entering_drawing_number'
-        })
+        self.sessions.update(
+            user.id,
+            product_type=product,
+            current_step='entering_drawing_number'
+        )
         
         # Проверяем, требуется ли номер изделия
         requires_number = is_product_number_required(product)
         number_text = "и номер изделия" if requires_number else ""
         
+        number_format = "чертеж;номер изделия" if requires_number else "чертеж"
+        
         await update.message.reply_text(
             f"✅ Выбрано изделие: {product_name}\n\n"
             f"Теперь введи номер чертежа {number_text}.\n\n"
+            f"Сразу несколько изделий: пришли список строками «{number_format}» или CSV-файл.\n\n"
+            f"🔎 Подсказки: набери «@{context.bot.username} » и начало номера чертежа.\n\n"
             f"Сначала введи номер чертежа:",
-            reply_markup=ReplyKeyboardMarkup([["❌ Отмена"]], resize_keyboard=True)
+            reply_markup=CANCEL_KEYBOARD
         )
     
     async def cancel_request(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена создания заявки"""
         user = update.effective_user
-        db.delete_session(user.id)
-        
-        main_keyboard = ReplyKeyboardMarkup([
-            ["📋 Мои заявки", "➕ Новая заявка"],
-            ["⚠️ Несоответствия", "📊 Статистика"]
-        ], resize_keyboard=True)
+        self.sessions.finish(user.id)
         
         await update.message.reply_text(
             "❌ Создание заявки отменено.",
-            reply_markup=main_keyboard
+            reply_markup=self.main_keyboard(user.id)
         )
     
     async def show_my_requests(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -232,43 +439,559 @@ class FactoryBot:
         user = update.effective_user
         
         try:
-            # Получаем пользователя
-            user_response = db.get_user_by_telegram_id(user.id)
+            # Первая страница: пользователь и его заявки одним вызовом
+            rows = (await self.db.get_master_requests(user.id, limit=REQUESTS_PAGE_SIZE + 1)).data
+            
+            if not rows:
+                # Пустой ответ: либо нет заявок, либо мастер не зарегистрирован
+                user_response = await self.db.get_user_by_telegram_id(user.id)
+                if not user_response.data:
+                    await update.message.reply_text("Сначала зарегистрируйся через /start")
+                    return
+                
+                await update.message.reply_text(
+                    "📭 У тебя пока нет заявок.\n\n"
+                    "Нажми '➕ Новая заявка' чтобы создать первую!",
+                    reply_markup=MAIN_KEYBOARD
+                )
+                return
+            
+            text, reply_markup = self.format_requests_page(rows, direction=None)
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            
+        except Exception as e:
+            logger.error("Error getting requests: %s", e)
+            await update.message.reply_text("❌ Ошибка при загрузке заявок")
+    
+    async def show_my_requests_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание заявок кнопками ◀️/▶️"""
+        query = update.callback_query
+        await query.answer()
+        
+        try:
+            direction, created_at, request_id = decode_cursor(query.data)
+            rows = (await self.db.get_master_requests(
+                update.effective_user.id,
+                cursor=(created_at, request_id),
+                direction=direction,
+                limit=REQUESTS_PAGE_SIZE + 1
+            )).data
+            
+            if not rows:
+                await query.edit_message_reply_markup(reply_markup=None)
+                return
+            
+            text, reply_markup = self.format_requests_page(rows, direction=direction)
+            await query.edit_message_text(text, reply_markup=reply_markup)
+            
+        except Exception as e:
+            logger.error("Error paging requests: %s", e)
+            await query.edit_message_text("❌ Ошибка при загрузке заявок")
+    
+    def format_requests_page(self, rows: list, direction):
+        """Текст страницы заявок и кнопки листания (rows - на одну запись больше страницы)"""
+        has_more = len(rows) > REQUESTS_PAGE_SIZE
+        if has_more:
+            # Лишняя запись - самая дальняя от курсора
+            rows = rows[1:] if direction == 'newer' else rows[:-1]
+        
+        has_newer = has_more if direction == 'newer' else direction is not None
+        has_older = has_more if direction != 'newer' else True
+        
+        message = "📋 Твои заявки:\n\n" if has_newer else "📋 Твои последние заявки:\n\n"
+        
+        for req in rows:
+            status_icon = STATUS_ICONS.get(req['status'], '⚪')
+            product_name = PRODUCTS.get(req['product_type'], req['product_type'])
+            product_number = req['product_number'] or 'Б/н'
+            message += f"{status_icon} {product_name} №{product_number}\n"
+            message += f"   Чертеж: {req['drawing_number']}\n"
+            message += f"   Статус: {REQUEST_STATUSES.get(req['status'], req['status'])}\n"
+            message += f"   Создана: {req['created_at'][:10]}\n\n"
+        
+        buttons = []
+        if has_newer:
+            buttons.append(InlineKeyboardButton("◀️ Новее", callback_data=encode_cursor('rq', 'newer', rows[0])))
+        if has_older:
+            buttons.append(InlineKeyboardButton("Старше ▶️", callback_data=encode_cursor('rq', 'older', rows[-1])))
+        
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
+    
+    async def show_statistics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Статистика заявок по участкам и статусам"""
+        message = self.stats_cache.get('all')
+        if message is None:
+            try:
+                rows = (await self.db.get_request_stats()).data
+            except Exception as e:
+                logger.error("Error getting statistics: %s", e)
+                await update.message.reply_text("❌ Ошибка при загрузке статистики")
+                return
+            message = self.format_statistics(rows)
+            self.stats_cache.set('all', message)
+        
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    def format_statistics(self, rows: list) -> str:
+        """Текст статистики из строк request_stats"""
+        if not rows:
+            return "📊 Заявок пока нет."
+        
+        by_workshop = {}
+        by_product = {}
+        by_status = {}
+        for row in rows:
+            statuses = by_workshop.setdefault(row['workshop'], {})
+            statuses[row['status']] = statuses.get(row['status'], 0) + row['total']
+            by_product[row['product_type']] = by_product.get(row['product_type'], 0) + row['total']
+            by_status[row['status']] = by_status.get(row['status'], 0) + row['total']
+        
+        def status_line(counts: dict) -> str:
+            line = " · ".join(f"{STATUS_ICONS[status]} {counts.get(status, 0)}" for status in REQUEST_STATUSES)
+            other = sum(counts.values()) - sum(counts.get(status, 0) for status in REQUEST_STATUSES)
+            return f"{line} · ⚪ {other}" if other else line
+        
+        message = f"📊 *Статистика заявок*\n\n*Всего:* {sum(by_status.values())} ({status_line(by_status)})\n\n*По участкам:*\n"
+        for workshop, counts in sorted(by_workshop.items(), key=lambda item: -sum(item[1].values())):
+            message += f"{WORKSHOPS.get(workshop, workshop)}: {status_line(counts)}\n"
+        
+        message += "\n*По изделиям:*\n"
+        for product, total in sorted(by_product.items(), key=lambda item: -item[1]):
+            message += f"{PRODUCTS.get(product, product)}: {total}\n"
+        
+        return message
+    
+    async def check_registered(self, update: Update, telegram_id: int) -> bool:
+        """Заявки принимаются только от зарегистрированных (профиль - через кэш); если БД недоступна, master_id проверит outbox"""
+        try:
+            user_response = await self.db.get_user_by_telegram_id(telegram_id)
+        except Exception as e:
+            logger.warning("Error loading profile of %s: %s", telegram_id, e)
+            return True
+        if not user_response.data:
+            await update.message.reply_text("❌ Пользователь не найден. Зарегистрируйся через /start")
+            return False
+        return True
+    
+    def main_keyboard(self, telegram_id: int):
+        """Главная клавиатура по роли: у контролера ОТК - с кнопкой очереди; без профиля в кэше - клавиатура мастера"""
+        # В БД не ходим: клавиатура не должна задерживать ответ
+        profile = self.db.get_cached_user(telegram_id)
+        is_inspector = profile is not None and profile.get('role') in ('inspector', 'admin')
+        return INSPECTOR_KEYBOARD if is_inspector else MAIN_KEYBOARD
+    
+    async def get_inspector(self, telegram_id: int):
+        """Профиль пользователя, если он контролер ОТК или администратор (иначе None)"""
+        response = await self.db.get_user_by_telegram_id(telegram_id)
+        if response.data and response.data[0].get('role') in ('inspector', 'admin'):
+            return response.data[0]
+        return None
+    
+    async def show_inspection_queue(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Очередь приемки участка для контролера ОТК"""
+        try:
+            inspector = await self.get_inspector(update.effective_user.id)
+            if inspector is None:
+                await update.message.reply_text("Очередь приемки доступна только контролерам ОТК")
+                return
+            
+            text, reply_markup = await self.load_queue_page(inspector)
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            
+        except Exception as e:
+            logger.error("Error getting inspection queue: %s", e)
+            await update.message.reply_text("❌ Ошибка при загрузке очереди")
+    
+    async def show_inspection_queue_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Следующая страница очереди (кнопка «Дальше ▶️»)"""
+        query = update.callback_query
+        await query.answer()
+        
+        try:
+            inspector = await self.get_inspector(update.effective_user.id)
+            if inspector is None:
+                await query.edit_message_reply_markup(reply_markup=None)
+                return
+            
+            _, created_at, request_id = decode_cursor(query.data)
+            text, reply_markup = await self.load_queue_page(inspector, cursor=(created_at, request_id))
+            await query.edit_message_text(text, reply_markup=reply_markup)
+            
+        except Exception as e:
+            logger.error("Error paging inspection queue: %s", e)
+            await query.edit_message_text("❌ Ошибка при загрузке очереди")
+    
+    async def handle_inspection_action(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопки контролера: взять, принять или отклонить заявку"""
+        query = update.callback_query
+        user = update.effective_user
+        _, code, request_hex = query.data.split(':')
+        
+        try:
+            rows = (await self.db.transition_request(str(uuid.UUID(request_hex)), user.id, INSPECTION_ACTIONS[code])).data
+        except Exception as e:
+            logger.error("Error changing request status: %s", e)
+            await query.answer("❌ Ошибка, попробуй еще раз", show_alert=True)
+            return
+        
+        if not rows:
+            # Условный UPDATE не прошел: заявку уже взял или закрыл кто-то другой
+            await query.answer("Заявку уже обработал другой контролер", show_alert=True)
+        else:
+            req = rows[0]
+            await query.answer(status_label(req['status']))
+            # Мастер узнает о смене статуса сразу, без обновления списка
+            self.notifier.send(req['master_telegram_id'], self.format_status_change(req))
+            logger.info("Request %s moved to %s by user %s", req['id'], req['status'], user.id)
+        
+        try:
+            inspector = await self.get_inspector(user.id)
+            if inspector is not None:
+                text, reply_markup = await self.load_queue_page(inspector)
+                await query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.warning("Error refreshing inspection queue: %s", e)
+    
+    async def load_queue_page(self, inspector: dict, cursor: tuple = None):
+        """Страница очереди: на первой странице сверху - заявки, взятые контролером"""
+        queue = self.db.get_inspector_queue(inspector['workshop'], cursor=cursor, limit=QUEUE_PAGE_SIZE + 1)
+        if cursor is None:
+            claims, queue = await asyncio.gather(
+                self.db.get_inspector_claims(inspector['id'], limit=QUEUE_PAGE_SIZE),
+                queue
+            )
+            claims = claims.data
+        else:
+            claims, queue = [], await queue
+        return self.format_queue_page(inspector['workshop'], claims, queue.data)
+    
+    def format_queue_page(self, workshop: str, claims: list, rows: list):
+        """Текст очереди и кнопки действий (rows - на одну запись больше страницы)"""
+        has_more = len(rows) > QUEUE_PAGE_SIZE
+        rows = rows[:QUEUE_PAGE_SIZE]
+        
+        def item_line(req: dict) -> str:
+            product_name = PRODUCTS.get(req['product_type'], req['product_type'])
+            return f"• {product_name} №{req['product_number'] or 'Б/н'}, чертеж {req['drawing_number']} ({req['created_at'][:10]})\n"
+        
+        message = f"📥 Очередь ОТК · {WORKSHOPS.get(workshop, workshop)}\n\n"
+        buttons = []
+        if claims:
+            message += f"{STATUS_ICONS['in_progress']} У тебя на приемке:\n"
+            for req in claims:
+                message += item_line(req)
+                request_hex = uuid.UUID(req['id']).hex
+                buttons.append([
+                    InlineKeyboardButton(f"🟢 Принять {req['drawing_number']}", callback_data=f"it:a:{request_hex}"),
+                    InlineKeyboardButton("🔴 Отклонить", callback_data=f"it:r:{request_hex}")
+                ])
+            message += "\n"
+        
+        if rows:
+            message += f"{STATUS_ICONS['planned']} Ждут приемки:\n"
+            for req in rows:
+                message += item_line(req)
+                buttons.append([InlineKeyboardButton(
+                    f"📥 Взять {req['drawing_number']}",
+                    callback_data=f"it:c:{uuid.UUID(req['id']).hex}"
+                )])
+        elif not claims:
+            message += "Новых заявок нет 🎉"
+        
+        if has_more:
+            buttons.append([InlineKeyboardButton("Дальше ▶️", callback_data=encode_cursor('iq', 'older', rows[-1]))])
+        
+        return message, InlineKeyboardMarkup(buttons) if buttons else None
+    
+    def format_status_change(self, req: dict) -> str:
+        """Уведомление мастеру о смене статуса заявки"""
+        return (
+            f"Статус заявки: {status_label(req['status'])}\n\n"
+            f"Участок: {WORKSHOPS.get(req['workshop'], req['workshop'])}\n"
+            f"Изделие: {PRODUCTS.get(req['product_type'], req['product_type'])}\n"
+            f"Чертеж: {req['drawing_number']}\n"
+            f"Номер изделия: {req['product_number'] or 'Б/н'}"
+        )
+    
+    async def show_nonconformances(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Меню «⚠️ Несоответствия»: контролер выбирает заявку, мастер видит замечания по своим заявкам"""
+        try:
+            user_response = await self.db.get_user_by_telegram_id(update.effective_user.id)
             if not user_response.data:
                 await update.message.reply_text("Сначала зарегистрируйся через /start")
                 return
+            profile = user_response.data[0]
             
-            current_user = user_response.data[0]
+            if profile.get('role') in ('inspector', 'admin'):
+                claims = (await self.db.get_inspector_claims(profile['id'], limit=QUEUE_PAGE_SIZE)).data
+                if not claims:
+                    await update.message.reply_text(
+                        "Несоответствие оформляется по заявке, взятой на приемку.\n\n"
+                        "Возьми заявку в «📥 Очередь ОТК»."
+                    )
+                    return
+                
+                buttons = [
+                    [InlineKeyboardButton(
+                        f"⚠️ {PRODUCTS.get(req['product_type'], req['product_type'])} №{req['product_number'] or 'Б/н'}, {req['drawing_number']}",
+                        callback_data=f"nc:{uuid.UUID(req['id']).hex}"
+                    )]
+                    for req in claims
+                ]
+                await update.message.reply_text(
+                    "Выбери заявку, по которой найдено несоответствие:",
+                    reply_markup=InlineKeyboardMarkup(buttons)
+                )
+                return
             
-            # Получаем заявки пользователя
-            requests_response = db.get_user_requests(current_user['id'], limit=5)
-            requests = requests_response.data
+            rows = (await self.db.get_master_nonconformances(profile['id'], limit=NONCONFORMANCES_PAGE_SIZE)).data
+            text, reply_markup = self.format_nonconformances(rows)
+            await update.message.reply_text(text, reply_markup=reply_markup)
+            
+        except Exception as e:
+            logger.error("Error getting nonconformances: %s", e)
+            await update.message.reply_text("❌ Ошибка при загрузке несоответствий")
+    
+    def format_nonconformances(self, rows: list):
+        """Список несоответствий мастера и кнопки просмотра фото"""
+        if not rows:
+            return "✅ Несоответствий по твоим заявкам нет.", None
+        
+        message = "⚠️ Несоответствия по твоим заявкам:\n\n"
+        buttons = []
+        for number, row in enumerate(rows, start=1):
+            req = row['requests']
+            product_name = PRODUCTS.get(req['product_type'], req['product_type'])
+            message += f"{number}. {product_name} №{req['product_number'] or 'Б/н'}, чертеж {req['drawing_number']}\n"
+            message += f"   {row['description']}\n"
+            message += f"   {row['created_at'][:10]}"
+            if row['photos']:
+                message += f" · 📷 {len(row['photos'])}"
+                buttons.append(InlineKeyboardButton(f"📷 {number}", callback_data=f"np:{uuid.UUID(row['id']).hex}"))
+            message += "\n\n"
+        
+        rows_of_buttons = [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+        return message, InlineKeyboardMarkup(rows_of_buttons) if buttons else None
+    
+    async def start_nonconformance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выбрана заявка для нового несоответствия"""
+        query = update.callback_query
+        await query.answer()
+        
+        request_id = str(uuid.UUID(query.data.split(':')[1]))
+        try:
+            inspector = await self.get_inspector(update.effective_user.id)
+            req = await self.get_claimed_request(inspector, request_id) if inspector is not None else None
+        except Exception as e:
+            logger.error("Error loading request for nonconformance: %s", e)
+            await query.message.reply_text("❌ Ошибка при загрузке заявки")
+            return
+        if req is None:
+            await query.message.reply_text("❌ Несоответствие оформляется только по заявке, взятой тобой на приемку")
+            return
+        
+        self.sessions.start(update.effective_user.id, request_id=request_id, photos=[], current_step='nc_describing')
+        
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text(
+            "✏️ Опиши несоответствие текстом.\n\n"
+            "Фото можно приложить сразу (с подписью-описанием) или после описания.",
+            reply_markup=NONCONFORMANCE_KEYBOARD
+        )
+    
+    async def get_claimed_request(self, inspector: dict, request_id: str):
+        """Заявка с мастером, если ее взял на приемку этот контролер (иначе None)"""
+        rows = (await self.db.get_request_with_master(request_id)).data
+        if rows and rows[0]['status'] == 'in_progress' and rows[0]['inspector_id'] == inspector['id']:
+            return rows[0]
+        return None
+    
+    async def handle_nonconformance_description(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Описание несоответствия (повторный текст заменяет описание)"""
+        self.sessions.update(
+            update.effective_user.id,
+            description=update.message.text.strip(),
+            current_step='nc_attaching_photos'
+        )
+        
+        await update.message.reply_text(
+            "📎 Пришли фото несоответствия (можно несколько) и нажми «✅ Готово».",
+            reply_markup=NONCONFORMANCE_KEYBOARD
+        )
+    
+    async def handle_nonconformance_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Фото несоответствия: запоминаем ссылку file_id, сам файл не скачиваем"""
+        user = update.effective_user
+        message = update.message
+        session = self.sessions.get(user.id)
+        if session is None or session['current_step'] not in NONCONFORMANCE_STEPS:
+            await message.reply_text("Фото принимаются при оформлении несоответствия: нажми «⚠️ Несоответствия».")
+            return
+        
+        photos = session['photos'] or []
+        ref = photo_ref(message.photo)
+        if all(photo['file_unique_id'] != ref['file_unique_id'] for photo in photos):
+            if len(photos) >= settings.NONCONFORMANCE_MAX_PHOTOS:
+                await message.reply_text(f"❌ Не больше {settings.NONCONFORMANCE_MAX_PHOTOS} фото на одно несоответствие")
+                return
+            photos = photos + [ref]
+        
+        previous_group = session.get('media_group_id')
+        fields = {'photos': photos}
+        if message.caption:
+            fields['description'] = message.caption.strip()
+        if fields.get('description') or session['description']:
+            fields['current_step'] = 'nc_attaching_photos'
+        self.sessions.update(user.id, media_group_id=message.media_group_id, **fields)
+        
+        # На альбом отвечаем один раз, а не на каждое фото
+        if message.media_group_id is None or message.media_group_id != previous_group:
+            await message.reply_text(
+                "📎 Фото добавлено. Пришли еще или нажми «✅ Готово»." if fields.get('current_step')
+                else "📎 Фото добавлено. Теперь опиши несоответствие текстом.",
+                reply_markup=NONCONFORMANCE_KEYBOARD
+            )
+    
+    async def finish_nonconformance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Сохранить несоответствие и сообщить мастеру"""
+        user = update.effective_user
+        session = self.sessions.get(user.id)
+        if not session['description']:
+            await update.message.reply_text("✏️ Сначала опиши несоответствие текстом.")
+            return
+        
+        try:
+            inspector = await self.get_inspector(user.id)
+            if inspector is None:
+                self.sessions.finish(user.id)
+                await update.message.reply_text("Несоответствия оформляют контролеры ОТК", reply_markup=MAIN_KEYBOARD)
+                return
             
-            if not requests:
+            # Номер заявки пришел из callback data: проверяем, что заявку ведет этот контролер
+            req = await self.get_claimed_request(inspector, session['request_id'])
+            if req is None:
+                self.sessions.finish(user.id)
                 await update.message.reply_text(
-                    "📭 У тебя пока нет заявок.\n\n"
-                    "Нажми '➕ Новая заявка' чтобы создать первую!",
-                    reply_markup=ReplyKeyboardMarkup([
-                        ["📋 Мои заявки", "➕ Новая заявка"]
-                    ], resize_keyboard=True)
+                    "❌ Заявка не найдена или не взята тобой на приемку",
+                    reply_markup=INSPECTOR_KEYBOARD
                 )
                 return
             
-            message = "📋 Твои последние заявки:\n\n"
+            photos = session['photos'] or []
+            # id сессии - ключ идемпотентности: повторное «Готово» не создаст второе несоответствие
+            await self.db.create_nonconformance({
+                'id': session['id'],
+                'request_id': session['request_id'],
+                'author_id': inspector['id'],
+                'description': session['description'],
+                'photos': photos
+            })
+            self.sessions.finish(user.id)
+        except Exception as e:
+            logger.error("Error saving nonconformance: %s", e)
+            await update.message.reply_text("❌ Ошибка при сохранении несоответствия")
+            return
+        
+        await update.message.reply_text(
+            f"✅ Несоответствие записано (фото: {len(photos)}). Мастер получит уведомление.",
+            reply_markup=INSPECTOR_KEYBOARD
+        )
+        if req.get('master'):
+            self.notifier.send(req['master']['telegram_id'], (
+                f"⚠️ Несоответствие по заявке\n\n"
+                f"Изделие: {PRODUCTS.get(req['product_type'], req['product_type'])} №{req['product_number'] or 'Б/н'}\n"
+                f"Чертеж: {req['drawing_number']}\n\n"
+                f"{session['description']}\n\n"
+                f"Фото: {len(photos)} — смотри «⚠️ Несоответствия»"
+            ))
+        logger.info("Nonconformance %s saved by user %s with %s photos", session['id'], user.id, len(photos))
+    
+    async def send_nonconformance_photos(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Фото несоответствия: отправка по file_id, файлы через бота не проходят"""
+        query = update.callback_query
+        await query.answer()
+        
+        try:
+            rows = (await self.db.get_nonconformance(str(uuid.UUID(query.data.split(':')[1])))).data
+            photos = rows[0]['photos'] if rows else []
+            chat_id = update.effective_chat.id
+            if len(photos) == 1:
+                await context.bot.send_photo(chat_id, photos[0]['file_id'])
+            elif photos:
+                # В одном альбоме Telegram - до 10 фото
+                for start in range(0, len(photos), 10):
+                    await context.bot.send_media_group(
+                        chat_id,
+                        [InputMediaPhoto(photo['file_id']) for photo in photos[start:start + 10]]
+                    )
+        except Exception as e:
+            logger.error("Error sending nonconformance photos: %s", e)
+            await query.message.reply_text("❌ Ошибка при загрузке фото")
+    
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузка заявок файлом: /export [ГГГГ-ММ | ГГГГ-ММ-ДД] [csv | xlsx]"""
+        user = update.effective_user
+        fmt, period = 'csv', None
+        for arg in context.args or []:
+            if arg.lower() in ('csv', 'xlsx'):
+                fmt = arg.lower()
+            else:
+                period = arg
+        
+        try:
+            date_from, date_to = parse_period(period, settings.EXPORT_TIMEZONE)
+        except ValueError:
+            await update.message.reply_text(
+                "Формат: /export [ГГГГ-ММ | ГГГГ-ММ-ДД] [csv | xlsx]\n"
+                "Например: /export 2024-05 xlsx"
+            )
+            return
+        if fmt == 'xlsx' and not xlsx_available():
+            await update.message.reply_text("❌ XLSX недоступен на сервере, используй CSV")
+            return
+        
+        path = None
+        try:
+            inspector = await self.get_inspector(user.id)
+            if inspector is None:
+                await update.message.reply_text("Выгрузка доступна контролерам ОТК и администраторам")
+                return
+            # Контролер выгружает свой участок, администратор - все
+            workshop = None if inspector['role'] == 'admin' else inspector['workshop']
+            
+            await update.message.reply_text("⏳ Готовлю выгрузку...")
+            path, count = await export_requests(
+                self.db, fmt, date_from, date_to,
+                workshop=workshop,
+                chunk_size=settings.EXPORT_CHUNK_SIZE,
+                directory=settings.EXPORT_DIR
+            )
             
-            for req in requests:
-                status_icon = "🟡" if req['status'] == 'planned' else "🟢" if req['status'] == 'success' else "🔴"
-                product_number = req['product_number'] or 'Б/н'
-                message += f"{status_icon} {req['product_type']} №{product_number}\n"
-                message += f"   Чертеж: {req['drawing_number']}\n"
-                message += f"   Статус: {req['status']}\n"
-                message += f"   Создана: {req['created_at'][:10]}\n\n"
+            if count == 0:
+                await update.message.reply_text("📭 За этот период заявок нет")
+                return
+            size = os.path.getsize(path)
+            if size > settings.EXPORT_MAX_DOCUMENT_SIZE:
+                await update.message.reply_text(
+                    f"❌ Файл слишком большой для Telegram ({size // (1024 * 1024)} МБ). "
+                    f"Выбери период короче или выгрузи через API."
+                )
+                return
             
-            await update.message.reply_text(message)
+            with open(path, 'rb') as file:
+                await update.message.reply_document(
+                    file,
+                    filename=f"requests_{date_from:%Y-%m-%d}_{date_to:%Y-%m-%d}.{fmt}",
+                    caption=f"📄 Заявок: {count}"
+                )
+            logger.info("Exported %s requests for user %s", count, user.id)
             
         except Exception as e:
-            logger.error(f"Error getting requests: {e}")
-            await update.message.reply_text("❌ Ошибка при загрузке заявок")
+            logger.error("Error exporting requests: %s", e)
+            await update.message.reply_text("❌ Ошибка при выгрузке заявок")
+        finally:
+            if path is not None:
+                os.remove(path)
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
@@ -276,8 +999,12 @@ class FactoryBot:
             "🤖 *Помощь по боту:*\n\n"
             "*/start* - начать работу с ботом\n"
             "*/help* - показать эту справку\n"
+            "*/export* \\[ГГГГ-ММ] \\[xlsx] - выгрузка заявок (для ОТК)\n"
             "📋 *Мои заявки* - посмотреть свои заявки\n"
             "➕ *Новая заявка* - создать заявку на приемку\n"
+            "📊 *Статистика* - сводка заявок по участкам\n"
+            "📥 *Очередь ОТК* (/queue) - заявки участка для контролера\n"
+            "⚠️ *Несоответствия* - замечания ОТК по заявкам (контролер оформляет с фото)\n"
             "❌ *Отмена* - отменить создание заявки\n\n"
             "*Процесс создания заявки:*\n"
             "1. Выбери тип трансформатора\n"
@@ -287,128 +1014,241 @@ class FactoryBot:
         )
         await update.message.reply_text(help_text, parse_mode='Markdown')
     
-    async def handle_unknown(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик неизвестных сообщений"""
-        # Проверяем, не находится ли пользователь в процессе создания заявки
+    async def handle_drawing_number(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ввод номера чертежа"""
         user = update.effective_user
-        session_response = db.get_session(user.id)
+        session = self.sessions.get(user.id)
+        drawing_number = update.message.text.strip()
         
-        if session_response.data:
-            session = session_response.data[0]
-            current_step = session.get('current_step')
-            
-            if current_step == 'entering_drawing_number':
-                # Пользователь вводит номер чертежа
-                drawing_number = update.message.text
-                
-                # Обновляем сессию
-                db.save_session({
-                    'telegram_id': user.id,
-                    'transformer_type': session['transformer_type'],
-                    'workshop': session['workshop'],
-                    'product_type': session['product_type'],
-                    'drawing_number': drawing_number,
-                    'current_step': 'entering_product_number'
-                })
-                
-                requires_number = is_product_number_required(session['product_type'])
-                
-                if requires_number:
-                    await update.message.reply_text(
-                        f"✅ Номер чертежа: {drawing_number}\n\n"
-                        f"Теперь введи номер изделия:",
-                        reply_markup=ReplyKeyboardMarkup([["❌ Отмена"]], resize_keyboard=True)
-                    )
-                else:
-                    # Создаем заявку без номера изделия
-                    await self.finalize_request(update, user, session, drawing_number, None)
-                
-            elif current_step == 'entering_product_number':
-                # Пользователь вводит номер изделия
-                product_number = update.message.text
-                drawing_number = session['drawing_number']
-                
-                # Создаем заявку
-                await self.finalize_request(update, user, session, drawing_number, product_number)
-                
+        if '\n' in drawing_number:
+            # Вставлен список: пакетная подача
+            await self.submit_bulk(update, user, session, split_text(drawing_number))
+            return
+        
+        # Обновляем сессию
+        self.sessions.update(
+            user.id,
+            drawing_number=drawing_number,
+            current_step='entering_product_number'
+        )
+        
+        requires_number = is_product_number_required(session['product_type'])
+        
+        if requires_number:
+            await update.message.reply_text(
+                f"✅ Номер чертежа: {drawing_number}\n\n"
+                f"Теперь введи номер изделия:",
+                reply_markup=CANCEL_KEYBOARD
+            )
         else:
+            # Создаем заявку без номера изделия
+            await self.finalize_request(update, user, session, drawing_number, None)
+    
+    async def handle_product_number(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ввод номера изделия"""
+        user = update.effective_user
+        session = self.sessions.get(user.id)
+        product_number = update.message.text.strip()
+        
+        # Создаем заявку
+        await self.finalize_request(update, user, session, session['drawing_number'], product_number)
+    
+    async def handle_drawing_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Inline-подсказки номеров чертежей для выбранных типа, участка и изделия"""
+        query = update.inline_query
+        session = self.sessions.get(query.from_user.id)
+        prefix = query.query.strip()
+        drawings = []
+        if session is not None and session['current_step'] == 'entering_drawing_number' \
+                and len(prefix) >= settings.DRAWING_MIN_PREFIX:
+            try:
+                drawings = await self.drawings.suggest(
+                    (session['transformer_type'], session['workshop'], session['product_type']),
+                    prefix
+                )
+            except Exception as e:
+                logger.error("Error loading drawing numbers: %s", e)
+        
+        # Выбранная подсказка приходит обычным сообщением и попадает в handle_drawing_number
+        results = [
+            InlineQueryResultArticle(
+                id=str(number),
+                title=drawing_number,
+                input_message_content=InputTextMessageContent(drawing_number)
+            )
+            for number, drawing_number in enumerate(drawings)
+        ]
+        await query.answer(results, cache_time=0, is_personal=True)
+    
+    async def handle_unknown(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик неизвестных сообщений"""
+        if self.sessions.get(update.effective_user.id) is not None:
+            # Мастер на шаге выбора, но прислал что-то не с клавиатуры
+            await update.message.reply_text(
+                "❌ Выбери вариант кнопкой или нажми «❌ Отмена»."
+            )
+            return
+        
+        await update.message.reply_text(
+            "Я пока понимаю только основные команды 😊\n\n"
+            "Используй кнопки ниже для навигации:",
+            reply_markup=self.main_keyboard(update.effective_user.id)
+        )
+    
+    async def handle_bulk_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пакетная подача из CSV-файла"""
+        user = update.effective_user
+        session = self.sessions.get(user.id)
+        if session is None or session['current_step'] != 'entering_drawing_number':
             await update.message.reply_text(
-                "Я пока понимаю только основные команды 😊\n\n"
-                "Используй кнопки ниже для навигации:",
-                reply_markup=ReplyKeyboardMarkup([
-                    ["📋 Мои заявки", "➕ Новая заявка"],
-                    ["⚠️ Несоответствия", "📊 Статистика"]
-                ], resize_keyboard=True)
+                "Чтобы подать заявки списком, начни «➕ Новая заявка», выбери тип, участок и изделие, "
+                "а затем пришли CSV-файл."
             )
+            return
+        
+        document = update.message.document
+        if document.file_size and document.file_size > settings.BULK_MAX_FILE_SIZE:
+            await update.message.reply_text("❌ Файл слишком большой")
+            return
+        
+        try:
+            data = await (await document.get_file()).download_as_bytearray()
+            rows = split_csv(decode_document(bytes(data)))
+        except Exception as e:
+            logger.error("Error reading bulk file: %s", e)
+            await update.message.reply_text("❌ Не удалось прочитать файл. Нужен CSV: чертеж;номер изделия")
+            return
+        
+        await self.submit_bulk(update, user, session, rows)
+    
+    async def submit_bulk(self, update: Update, user, session, rows: list):
+        """Проверить строки списка и поставить все корректные заявки одной пачкой"""
+        is_valid, error_message = validate_selection(session['transformer_type'], session['workshop'], session['product_type'])
+        if not is_valid:
+            await update.message.reply_text(error_message)
+            return
+        
+        items, errors = validate_rows(rows, session['product_type'], settings.BULK_MAX_ROWS)
+        
+        if items and not await self.check_registered(update, user.id):
+            return
+        
+        if items:
+            try:
+                await self.outbox.enqueue([
+                    self.build_request(
+                        session, user.id, drawing_number, product_number,
+                        item_idempotency_key(session['id'], drawing_number, product_number)
+                    )
+                    for drawing_number, product_number in items
+                ])
+            except Exception as e:
+                logger.error("Error creating bulk requests: %s", e)
+                await update.message.reply_text("❌ Ошибка при создании заявок")
+                return
+        
+        # С ошибками сессия остается: исправленный список можно прислать целиком, принятые строки не задвоятся
+        if not errors:
+            self.sessions.finish(user.id)
+        
+        message = f"✅ Принято заявок: {len(items)}\n"
+        message += f"{WORKSHOPS[session['workshop']]} · {PRODUCTS[session['product_type']]}\n"
+        if errors:
+            shown = errors[:20]
+            message += f"\n❌ Ошибки ({len(errors)}):\n" + "\n".join(shown)
+            if len(errors) > len(shown):
+                message += f"\n… и еще {len(errors) - len(shown)}"
+            message += "\n\nИсправь строки и пришли список еще раз или нажми «❌ Отмена»."
+        
+        await update.message.reply_text(
+            message,
+            reply_markup=CANCEL_KEYBOARD if errors else self.main_keyboard(user.id)
+        )
+        logger.info("Bulk submission from user %s: %s accepted, %s rejected", user.id, len(items), len(errors))
+    
+    def build_request(self, session: dict, telegram_id: int, drawing_number: str, product_number, idempotency_key: str) -> dict:
+        """Заявка для журнала outbox; master_id по telegram_id мастера подставится при записи в БД"""
+        return {
+            'transformer_type': session['transformer_type'],
+            'workshop': session['workshop'],
+            'product_type': session['product_type'],
+            'drawing_number': drawing_number,
+            'product_number': product_number,
+            'telegram_id': telegram_id,
+            'status': 'planned',
+            'idempotency_key': idempotency_key
+        }
     
     async def finalize_request(self, update: Update, user, session, drawing_number: str, product_number: str):
         """Завершение создания заявки"""
+        # Одна сессия - одна заявка, поэтому повторная доставка не создаст дубликат
+        request_data = self.build_request(session, user.id, drawing_number, product_number, session['id'])
+        
+        if not await self.check_registered(update, user.id):
+            return
+        
         try:
-            # Получаем пользователя
-            user_response = db.get_user_by_telegram_id(user.id)
-            if not user_response.data:
-                await update.message.reply_text("❌ Пользователь не найден")
-                return
-            
-            current_user = user_response.data[0]
-            
-            # Создаем заявку
-            request_data = {
-                'transformer_type': session['transformer_type'],
-                'workshop': session['workshop'],
-                'product_type': session['product_type'],
-                'drawing_number': drawing_number,
-                'product_number': product_number,
-                'master_id': current_user['id'],
-                'status': 'planned'
-            }
-            
-            db.create_request(request_data)
-            
-            # Очищаем сессию
-            db.delete_session(user.id)
-            
-            # Основная клавиатура
-            main_keyboard = ReplyKeyboardMarkup([
-                ["📋 Мои заявки", "➕ Новая заявка"],
-                ["⚠️ Несоответствия", "📊 Статистика"]
-            ], resize_keyboard=True)
-            
-            product_name = PRODUCTS[session['product_type']]
-            workshop_name = WORKSHOPS[session['workshop']]
-            transformer_name = TRANSFORMER_TYPES[session['transformer_type']]
-            
-            await update.message.reply_text(
-                f"✅ *Заявка создана!*\n\n"
-                f"*Тип:* {transformer_name}\n"
-                f"*Участок:* {workshop_name}\n"
-                f"*Изделие:* {product_name}\n"
-                f"*Чертеж:* {drawing_number}\n"
-                f"*Номер изделия:* {product_number or 'Б/н'}\n"
-                f"*Статус:* 🟡 Планируется\n\n"
-                f"Заявка отправлена в ОТК для приемки.",
-                parse_mode='Markdown',
-                reply_markup=main_keyboard
-            )
-            
-            logger.info(f"Request created for user {user.id}")
-            
+            # Заявка сохраняется в локальный журнал, в БД ее запишет фоновая задача
+            await self.outbox.enqueue([request_data])
         except Exception as e:
-            logger.error(f"Error creating request: {e}")
+            logger.error("Error creating request: %s", e)
             await update.message.reply_text("❌ Ошибка при создании заявки")
+            return
+        
+        # Заявка принята: дальше БД не нужна, строку сессии удалит фоновая задача
+        self.sessions.finish(user.id)
+        
+        product_name = PRODUCTS[session['product_type']]
+        workshop_name = WORKSHOPS[session['workshop']]
+        transformer_name = TRANSFORMER_TYPES[session['transformer_type']]
+        
+        await update.message.reply_text(
+            f"✅ *Заявка создана!*\n\n"
+            f"*Тип:* {transformer_name}\n"
+            f"*Участок:* {workshop_name}\n"
+            f"*Изделие:* {product_name}\n"
+            f"*Чертеж:* {drawing_number}\n"
+            f"*Номер изделия:* {product_number or 'Б/н'}\n"
+            f"*Статус:* {status_label('planned')}\n\n"
+            f"Заявка отправлена в ОТК для приемки.",
+            parse_mode='Markdown',
+            reply_markup=self.main_keyboard(user.id)
+        )
+        
+        logger.info("Request created for user %s", user.id)
     
     def run(self):
         """Запуск бота"""
-        logger.info("Bot is starting...")
-        self.application.run_polling()
+        logger.info("Bot is starting in %s mode...", settings.BOT_MODE)
+        if settings.BOT_MODE in ('webhook', 'worker'):
+            self.run_webhook()
+        else:
+            self.application.run_polling()
+    
+    def run_webhook(self):
+        """Запуск бота в режиме webhook (FastAPI + uvicorn)"""
+        import uvicorn
+        from bot.webhook import create_app
+        
+        uvicorn.run(create_app(self), host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
 
 def main():
     """Точка входа для запуска бота"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=settings.LOG_LEVEL
+    )
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     if not bot_token:
         logger.error("TELEGRAM_BOT_TOKEN not found in environment variables")
         return
     
+    if settings.BOT_MODE == 'sharded':
+        # Входной процесс не создает ни бота, ни клиента БД: только раздает обновления процессам
+        from bot.shards import run_sharded
+        run_sharded(bot_token)
+        return
+    
     bot = FactoryBot(bot_token)
     bot.run()
 
@@ -0,0 +1,49 @@
+import hashlib
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import metrics
+from cache import TTLCache
+
+DUPLICATES_DROPPED = metrics.counter('bot_duplicate_updates_total', 'Отброшенные повторные обновления')
+
+class UpdateDeduplicator:
+    """Отбрасывает повторно доставленные обновления и двойные нажатия до вызова обработчиков"""
+
+    def __init__(self, max_size: int, update_ttl: float, message_window: float):
+        # update_id, которые уже обрабатывались (повторная доставка после таймаута или перезапуска)
+        self._updates = TTLCache(max_size, update_ttl)
+        # Отпечатки сообщений: одинаковый текст от того же пользователя в коротком окне
+        self._messages = TTLCache(max_size, message_window)
+
+    @staticmethod
+    def fingerprint(update: Update):
+        """Отпечаток сообщения: пользователь + текст (или файл)"""
+        message = update.message
+        if message is None or update.effective_user is None:
+            return None
+        content = message.text or (message.document.file_unique_id if message.document else None)
+        if content is None:
+            return None
+        return hashlib.blake2b(f"{update.effective_user.id}:{content}".encode(), digest_size=16).digest()
+
+    def is_duplicate(self, update: Update) -> bool:
+        """Проверить обновление и запомнить его"""
+        if self._updates.get(update.update_id, count=False) is not None:
+            DUPLICATES_DROPPED.inc(reason='update_id')
+            return True
+        self._updates.set(update.update_id, True)
+
+        fingerprint = self.fingerprint(update)
+        if fingerprint is None:
+            return False
+        if self._messages.get(fingerprint, count=False) is not None:
+            DUPLICATES_DROPPED.inc(reason='message')
+            return True
+        self._messages.set(fingerprint, True)
+        return False
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if self.is_duplicate(update):
+            raise ApplicationHandlerStop
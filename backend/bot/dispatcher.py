@@ -0,0 +1,53 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+# Маршрут для любого шага мастера (кнопки главного меню)
+ANY_STEP = '*'
+# Маршрут для произвольного текста на шаге (ввод номеров)
+FREE_TEXT = None
+
+def normalize_text(text: str) -> str:
+    """Привести текст сообщения к виду, в котором он хранится в таблице маршрутов"""
+    return ' '.join(text.split())
+
+class StepDispatcher:
+    """Маршрутизация текстовых сообщений по паре (шаг мастера, текст) через поиск в словаре"""
+
+    def __init__(self, sessions, fallback):
+        self.sessions = sessions
+        self.fallback = fallback
+        self._routes = {}
+
+    def route(self, steps, texts, handler):
+        """Зарегистрировать обработчик для шагов (None - нет сессии) и текстов (FREE_TEXT - любой текст)"""
+        for step in steps:
+            for text in texts:
+                key = (step, FREE_TEXT if text is FREE_TEXT else normalize_text(text))
+                if key in self._routes:
+                    raise ValueError(f"Route {key} is already registered")
+                self._routes[key] = handler
+
+    def wrap(self, decorator):
+        """Обернуть все обработчики маршрутов и fallback (например, замером времени)"""
+        # Один обработчик на многих маршрутах оборачивается один раз
+        wrapped = {}
+        for key, handler in self._routes.items():
+            if handler not in wrapped:
+                wrapped[handler] = decorator(handler)
+            self._routes[key] = wrapped[handler]
+        self.fallback = decorator(self.fallback)
+
+    def resolve(self, step, text: str):
+        """Найти обработчик: точный шаг, затем любой шаг, затем свободный текст шага"""
+        text = normalize_text(text)
+        routes = self._routes
+        return routes.get((step, text)) \
+            or routes.get((ANY_STEP, text)) \
+            or routes.get((step, FREE_TEXT)) \
+            or self.fallback
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        session = self.sessions.get(update.effective_user.id)
+        step = session['current_step'] if session is not None else None
+        handler = self.resolve(step, update.message.text)
+        await handler(update, context)
@@ -0,0 +1,122 @@
+"""
+ПОДСКАЗКИ НОМЕРОВ ЧЕРТЕЖЕЙ: ОТСОРТИРОВАННЫЕ СПИСКИ В ПАМЯТИ И ПОИСК ПРЕФИКСА ЧЕРЕЗ BISECT
+"""
+import asyncio
+import bisect
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DRAWINGS_INDEXED = metrics.gauge('drawing_index_size', 'Номера чертежей в индексе подсказок')
+DRAWING_LOOKUPS = metrics.counter('drawing_lookups_total', 'Поиски подсказок номера чертежа')
+
+def fold(drawing_number: str) -> str:
+    """Ключ сравнения: без учета регистра и пробелов по краям"""
+    return drawing_number.strip().casefold()
+
+class DrawingIndex:
+    """Различные номера чертежей по (тип трансформатора, участок, изделие); сочетание загружается при первом поиске, перечитывается раз в ttl секунд"""
+
+    def __init__(self, database, limit: int, ttl: float, page_size: int = 1000):
+        self.db = database
+        self.limit = limit
+        self.ttl = ttl
+        self.page_size = page_size
+        # Сочетание -> (отсортированные ключи fold, ключ -> номер как его ввели)
+        self._index = {}
+        # Сочетание -> time.monotonic() начала последней загрузки
+        self._loaded_at = {}
+        self._loading = {}
+        # Номера, пришедшие во время загрузки сочетания
+        self._pending = {}
+        self._size = 0
+
+    async def _load(self, key: tuple):
+        started = time.monotonic()
+        keys, originals = [], {}
+        after = None
+        while True:
+            rows = (await self.db.get_drawing_numbers(*key, after=after, limit=self.page_size)).data
+            for row in rows:
+                folded = fold(row['drawing_number'])
+                if folded not in originals:
+                    originals[folded] = row['drawing_number']
+                    keys.append(folded)
+            if len(rows) < self.page_size:
+                break
+            after = rows[-1]['drawing_number']
+        # БД сортирует по своим правилам сравнения, поэтому сортируем ключи сами
+        keys.sort()
+        previous = self._index.get(key)
+        if previous is not None:
+            self._size -= len(previous[0])
+        self._index[key] = (keys, originals)
+        self._loaded_at[key] = started
+        self._size += len(keys)
+        for drawing_number in self._pending.pop(key, []):
+            self._insert(key, drawing_number)
+        DRAWINGS_INDEXED.set(self._size)
+        logger.info("Loaded %s drawing numbers for %s", len(keys), key)
+
+    def _start_load(self, key: tuple) -> asyncio.Future:
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load(key))
+            loading.add_done_callback(lambda future: self._load_done(key, future))
+        return loading
+
+    def _load_done(self, key: tuple, future: asyncio.Future):
+        self._loading.pop(key, None)
+        if future.cancelled() or future.exception() is None:
+            return
+        self._pending.pop(key, None)
+        if key in self._index:
+            # Фоновое обновление не удалось: отвечаем по старому списку и пробуем снова через ttl
+            self._loaded_at[key] = time.monotonic()
+            logger.error("Error refreshing drawing numbers for %s: %s", key, future.exception())
+
+    async def _ensure(self, key: tuple):
+        if key in self._index:
+            if time.monotonic() - self._loaded_at[key] > self.ttl:
+                # Пока список перечитывается, отвечаем по старому
+                self._start_load(key)
+            return
+        # Одновременные поиски по новому сочетанию ждут одну загрузку
+        await asyncio.shield(self._start_load(key))
+
+    async def suggest(self, key: tuple, prefix: str) -> list:
+        """До limit номеров чертежей, начинающихся с prefix"""
+        DRAWING_LOOKUPS.inc()
+        await self._ensure(key)
+        keys, originals = self._index[key]
+        prefix = fold(prefix)
+        start = bisect.bisect_left(keys, prefix)
+        result = []
+        for folded in keys[start:start + self.limit]:
+            if not folded.startswith(prefix):
+                break
+            result.append(originals[folded])
+        return result
+
+    def _insert(self, key: tuple, drawing_number: str):
+        keys, originals = self._index[key]
+        folded = fold(drawing_number)
+        if folded not in originals:
+            originals[folded] = drawing_number
+            bisect.insort(keys, folded)
+            self._size += 1
+
+    def add(self, rows: list):
+        """Новые строки requests (подписчик outbox): дополнить уже загруженные сочетания"""
+        for row in rows:
+            key = (row['transformer_type'], row['workshop'], row['product_type'])
+            if key in self._index:
+                self._insert(key, row['drawing_number'])
+            if key in self._loading:
+                # Загрузка могла прочитать БД до этой строки: допишем номер в новый список
+                self._pending.setdefault(key, []).append(row['drawing_number'])
+            # Иначе сочетание еще не загружено: новые номера придут вместе с ним из БД
+        DRAWINGS_INDEXED.set(self._size)
@@ -0,0 +1,73 @@
+"""
+КЛАВИАТУРЫ БОТА (СТРОЯТСЯ ОДИН РАЗ ПРИ ИМПОРТЕ И ПЕРЕИСПОЛЬЗУЮТСЯ)
+"""
+from types import MappingProxyType
+
+from telegram import KeyboardButton, ReplyKeyboardMarkup
+
+from config.matrix import (
+    TRANSFORMER_TYPES,
+    WORKSHOPS,
+    PRODUCTS,
+    TRANSFORMER_WORKSHOPS,
+    WORKSHOP_PRODUCTS
+)
+
+# 1. КНОПКИ ГЛАВНОГО МЕНЮ
+BUTTON_MY_REQUESTS = "📋 Мои заявки"
+BUTTON_NEW_REQUEST = "➕ Новая заявка"
+BUTTON_NONCONFORMANCES = "⚠️ Несоответствия"
+BUTTON_STATISTICS = "📊 Статистика"
+BUTTON_INSPECTION_QUEUE = "📥 Очередь ОТК"
+BUTTON_CANCEL = "❌ Отмена"
+BUTTON_DONE = "✅ Готово"
+
+def _choice_keyboard(labels) -> ReplyKeyboardMarkup:
+    """Клавиатура выбора: по кнопке в строке и отмена в конце"""
+    buttons = [[KeyboardButton(label)] for label in labels]
+    buttons.append([BUTTON_CANCEL])
+    return ReplyKeyboardMarkup(buttons, resize_keyboard=True, one_time_keyboard=True)
+
+# 2. СТАТИЧЕСКИЕ КЛАВИАТУРЫ
+MAIN_KEYBOARD = ReplyKeyboardMarkup([
+    [BUTTON_MY_REQUESTS, BUTTON_NEW_REQUEST],
+    [BUTTON_NONCONFORMANCES, BUTTON_STATISTICS]
+], resize_keyboard=True)
+
+# Главное меню контролера ОТК: очередь приемки сверху
+INSPECTOR_KEYBOARD = ReplyKeyboardMarkup([
+    [BUTTON_INSPECTION_QUEUE],
+    [BUTTON_MY_REQUESTS, BUTTON_NEW_REQUEST],
+    [BUTTON_NONCONFORMANCES, BUTTON_STATISTICS]
+], resize_keyboard=True)
+
+REGISTRATION_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton(workshop)] for workshop in WORKSHOPS.values()],
+    resize_keyboard=True,
+    one_time_keyboard=True
+)
+
+TRANSFORMER_KEYBOARD = _choice_keyboard(TRANSFORMER_TYPES.values())
+
+CANCEL_KEYBOARD = ReplyKeyboardMarkup([[BUTTON_CANCEL]], resize_keyboard=True)
+
+NONCONFORMANCE_KEYBOARD = ReplyKeyboardMarkup([[BUTTON_DONE], [BUTTON_CANCEL]], resize_keyboard=True)
+
+# 3. КЛАВИАТУРЫ ПО МАТРИЦЕ: участки для типа трансформатора и изделия для участка
+WORKSHOP_KEYBOARDS = MappingProxyType({
+    transformer_type: _choice_keyboard(WORKSHOPS[workshop] for workshop in workshops)
+    for transformer_type, workshops in TRANSFORMER_WORKSHOPS.items()
+})
+
+PRODUCT_KEYBOARDS = MappingProxyType({
+    workshop: _choice_keyboard(PRODUCTS[product] for product in products)
+    for workshop, products in WORKSHOP_PRODUCTS.items()
+})
+
+def workshops_keyboard(transformer_type: str) -> ReplyKeyboardMarkup:
+    """Клавиатура участков для типа трансформатора"""
+    return WORKSHOP_KEYBOARDS.get(transformer_type, CANCEL_KEYBOARD)
+
+def products_keyboard(workshop: str) -> ReplyKeyboardMarkup:
+    """Клавиатура изделий для участка"""
+    return PRODUCT_KEYBOARDS.get(workshop, CANCEL_KEYBOARD)
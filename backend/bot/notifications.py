@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+import metrics
+from cache import TTLCache
+from config.matrix import PRODUCTS, WORKSHOPS
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_QUEUED = metrics.gauge('notifications_queued', 'Сообщения в очереди на отправку')
+NOTIFICATIONS_SENT = metrics.counter('notifications_sent_total', 'Отправленные уведомления')
+NOTIFICATIONS_FAILED = metrics.counter('notifications_failed_total', 'Неотправленные уведомления')
+
+# Больше строк в одной сводке не показываем
+DIGEST_MAX_LINES = 20
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate событий в секунду с запасом burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        """Дождаться свободного токена"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class Notifier:
+    """Фоновая рассылка уведомлений с учетом лимитов Telegram (общего и на один чат)"""
+
+    def __init__(self, bot, database, global_rate: float, chat_interval: float,
+                 digest_window: float, inspectors_ttl: float):
+        self.bot = bot
+        self.db = database
+        self.chat_interval = chat_interval
+        self.digest_window = digest_window
+        self._bucket = TokenBucket(global_rate, burst=max(1, int(global_rate)))
+        # Когда в чат можно писать снова (для чатов без сообщений в очереди)
+        self._chat_ready_at = {}
+        # Очередь сообщений каждого чата и куча (когда чат готов, порядковый номер, чат) для чатов с сообщениями
+        self._chats = {}
+        self._ready = []
+        self._order = itertools.count()
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Новые заявки по участкам, ждущие сводки
+        self._pending = {}
+        self._pending_event = asyncio.Event()
+        self._digest_lock = asyncio.Lock()
+        self._inspectors = TTLCache(len(WORKSHOPS) * 2, inspectors_ttl)
+        self._tasks = []
+
+    def send(self, chat_id: int, text: str):
+        """Поставить сообщение в очередь (не ждет отправки)"""
+        messages = self._chats.get(chat_id)
+        if messages is None:
+            messages = self._chats[chat_id] = deque()
+            self._schedule(chat_id, self._chat_ready_at.pop(chat_id, 0))
+        messages.append(text)
+        self._queued += 1
+        self._idle.clear()
+        NOTIFICATIONS_QUEUED.set(self._queued)
+
+    def _schedule(self, chat_id: int, ready_at: float):
+        heapq.heappush(self._ready, (ready_at, next(self._order), chat_id))
+        self._wakeup.set()
+
+    def notify_new_requests(self, rows: list):
+        """Новые строки requests: собрать в сводки для контролеров участка"""
+        for row in rows:
+            self._pending.setdefault(row['workshop'], []).append(row)
+        if rows:
+            self._pending_event.set()
+
+    async def get_inspectors(self, workshop: str) -> list:
+        """Telegram ID контролеров, подписанных на участок"""
+        chat_ids = self._inspectors.get(workshop)
+        if chat_ids is None:
+            response = await self.db.get_inspectors(workshop)
+            chat_ids = [row['telegram_id'] for row in response.data]
+            self._inspectors.set(workshop, chat_ids)
+        return chat_ids
+
+    def format_digest(self, workshop: str, rows: list) -> str:
+        """Одна заявка - подробно, несколько - сводкой"""
+        workshop_name = WORKSHOPS.get(workshop, workshop)
+        if len(rows) == 1:
+            row = rows[0]
+            return (
+                f"🆕 Новая заявка на приемку\n\n"
+                f"Участок: {workshop_name}\n"
+                f"Изделие: {PRODUCTS.get(row['product_type'], row['product_type'])}\n"
+                f"Чертеж: {row['drawing_number']}\n"
+                f"Номер изделия: {row['product_number'] or 'Б/н'}"
+            )
+
+        lines = [
+            f"• {PRODUCTS.get(row['product_type'], row['product_type'])} — {row['drawing_number']} №{row['product_number'] or 'Б/н'}"
+            for row in rows[:DIGEST_MAX_LINES]
+        ]
+        if len(rows) > DIGEST_MAX_LINES:
+            lines.append(f"… и еще {len(rows) - DIGEST_MAX_LINES}")
+        return f"🆕 Новые заявки на приемку: {len(rows)}\nУчасток: {workshop_name}\n\n" + "\n".join(lines)
+
+    async def _send_digests(self):
+        """Накопленные заявки - сводками в очередь отправки"""
+        async with self._digest_lock:
+            self._pending_event.clear()
+            pending, self._pending = self._pending, {}
+            for workshop, rows in pending.items():
+                try:
+                    chat_ids = await self.get_inspectors(workshop)
+                except Exception as e:
+                    logger.error("Error loading inspectors for %s: %s", workshop, e)
+                    continue
+                text = self.format_digest(workshop, rows)
+                for chat_id in chat_ids:
+                    self.send(chat_id, text)
+
+    async def _collect_digests(self):
+        while True:
+            await self._pending_event.wait()
+            # Окно, в котором всплеск заявок склеивается в одно сообщение
+            await asyncio.sleep(self.digest_window)
+            await self._send_digests()
+
+    async def _send_next(self):
+        # Чат, который раньше всех может принять сообщение; остальные чаты его не ждут
+        _, _, chat_id = heapq.heappop(self._ready)
+        messages = self._chats[chat_id]
+        text = messages[0]
+        await self._bucket.acquire()
+        try:
+            await self.bot.send_message(chat_id, text)
+        except RetryAfter as e:
+            # Telegram просит подождать: откладываем только этот чат
+            self._schedule(chat_id, time.monotonic() + e.retry_after)
+            return
+        except Forbidden:
+            # Пользователь заблокировал бота
+            NOTIFICATIONS_FAILED.inc()
+            logger.warning("Chat %s blocked the bot", chat_id)
+        except TelegramError as e:
+            NOTIFICATIONS_FAILED.inc()
+            logger.error("Error notifying %s: %s", chat_id, e)
+        else:
+            NOTIFICATIONS_SENT.inc()
+
+        messages.popleft()
+        self._queued -= 1
+        NOTIFICATIONS_QUEUED.set(self._queued)
+        ready_at = time.monotonic() + self.chat_interval
+        if messages:
+            self._schedule(chat_id, ready_at)
+        else:
+            del self._chats[chat_id]
+            self._chat_ready_at[chat_id] = ready_at
+        if not self._queued:
+            self._idle.set()
+
+    async def _send_loop(self):
+        while True:
+            self._wakeup.clear()
+            if not self._ready:
+                await self._wakeup.wait()
+                continue
+            delay = self._ready[0][0] - time.monotonic()
+            if delay > 0:
+                # Ждем готовности чата, но просыпаемся раньше, если пришло сообщение в другой чат
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._send_next()
+
+    async def flush(self, timeout: float):
+        """Сразу разослать накопленные сводки и дождаться отправки очереди, но не дольше timeout секунд"""
+        async def drain():
+            await self._send_digests()
+            await self._idle.wait()
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notifier stopped with %s messages not sent", self._queued)
+
+    def start_background(self):
+        """Запустить сбор сводок и отправку"""
+        self._tasks = [
+            asyncio.create_task(self._collect_digests()),
+            asyncio.create_task(self._send_loop())
+        ]
+
+    async def stop(self):
+        """Остановить рассылку"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
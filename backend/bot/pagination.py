@@ -0,0 +1,23 @@
+"""
+КУРСОРЫ KEYSET-ПАГИНАЦИИ В CALLBACK_DATA (ЛИМИТ TELEGRAM - 64 БАЙТА)
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_cursor(prefix: str, direction: str, row: dict) -> str:
+    """Курсор по (created_at, id) строки: 'prefix:o|n:микросекунды:uuid без дефисов'"""
+    created_at = datetime.fromisoformat(row['created_at'])
+    microseconds = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{prefix}:{direction[0]}:{microseconds}:{uuid.UUID(row['id']).hex}"
+
+def decode_cursor(data: str) -> tuple[str, str, str]:
+    """Разобрать курсор в (направление, created_at в ISO, id)"""
+    _, direction, microseconds, row_id = data.split(':')
+    created_at = EPOCH + timedelta(microseconds=int(microseconds))
+    return (
+        'newer' if direction == 'n' else 'older',
+        created_at.isoformat(),
+        str(uuid.UUID(row_id))
+    )
@@ -0,0 +1,94 @@
+"""
+ФОТО НЕСООТВЕТСТВИЙ: В БД ХРАНЯТСЯ ТОЛЬКО ССЫЛКИ FILE_ID, МИНИАТЮРЫ СКАЧИВАЮТСЯ ПО ТРЕБОВАНИЮ В ДИСКОВЫЙ КЭШ
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_HITS = metrics.counter('thumbnail_cache_hits_total', 'Миниатюры, отданные из дискового кэша')
+THUMBNAIL_MISSES = metrics.counter('thumbnail_cache_misses_total', 'Миниатюры, скачанные из Telegram')
+THUMBNAIL_BYTES = metrics.gauge('thumbnail_cache_bytes', 'Объем дискового кэша миниатюр')
+
+def photo_ref(sizes) -> dict:
+    """Ссылка на фото из сообщения: самый крупный размер и готовая миниатюра Telegram (самый мелкий)"""
+    largest, smallest = sizes[-1], sizes[0]
+    return {
+        'file_id': largest.file_id,
+        'file_unique_id': largest.file_unique_id,
+        'thumb_file_id': smallest.file_id
+    }
+
+class ThumbnailCache:
+    """Миниатюры на диске: скачиваются при первом запросе, самые давние удаляются сверх max_bytes"""
+
+    def __init__(self, bot, directory: str, max_bytes: int):
+        self.bot = bot
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Имя файла -> размер, от давно запрошенных к недавним (заполняется при первом обращении)
+        self._files = None
+        self._total = 0
+        self._downloads = {}
+
+    def _scan(self) -> OrderedDict:
+        os.makedirs(self.directory, exist_ok=True)
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith('.jpg')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        return OrderedDict((entry.name, entry.stat().st_size) for entry in entries)
+
+    def _evict(self) -> list:
+        removed = []
+        while self._total > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._total -= size
+            removed.append(name)
+        THUMBNAIL_BYTES.set(self._total)
+        return removed
+
+    def _remove(self, names: list):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, photo: dict) -> str:
+        """Путь к миниатюре фото (ссылка из photo_ref)"""
+        if self._files is None:
+            self._files = await asyncio.to_thread(self._scan)
+            self._total = sum(self._files.values())
+
+        name = f"{photo['file_unique_id']}.jpg"
+        path = os.path.join(self.directory, name)
+        if name in self._files:
+            THUMBNAIL_HITS.inc()
+            self._files.move_to_end(name)
+            return path
+
+        # Одновременные запросы одной миниатюры ждут одно скачивание
+        download = self._downloads.get(name)
+        if download is None:
+            download = self._downloads[name] = asyncio.ensure_future(self._download(photo, name, path))
+            download.add_done_callback(lambda _: self._downloads.pop(name, None))
+        await asyncio.shield(download)
+        return path
+
+    async def _download(self, photo: dict, name: str, path: str):
+        THUMBNAIL_MISSES.inc()
+        file = await self.bot.get_file(photo['thumb_file_id'])
+        partial = path + '.part'
+        await file.download_to_drive(partial)
+        os.replace(partial, path)
+        self._files[name] = os.path.getsize(path)
+        self._total += self._files[name]
+        removed = self._evict()
+        if removed:
+            await asyncio.to_thread(self._remove, removed)
+            logger.info("Evicted %s thumbnails, cache size %s bytes", len(removed), self._total)
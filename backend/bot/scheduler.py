@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+from instrumentation import DbRequestCount
+
+UPDATES_WAITING = metrics.gauge('bot_updates_waiting', 'Обновления в очереди за предыдущим обновлением того же пользователя')
+UPDATES_IN_PROGRESS = metrics.gauge('bot_updates_in_progress', 'Обновления в обработке')
+USERS_ACTIVE = metrics.gauge('bot_users_active', 'Пользователи с обновлениями в обработке или в очереди')
+UPDATES_PROCESSED = metrics.counter('bot_updates_processed_total', 'Обработанные обновления')
+UPDATE_DURATION = metrics.histogram('bot_update_duration_seconds', 'Время обработки обновления всеми обработчиками')
+UPDATE_DB_REQUESTS = metrics.histogram(
+    'bot_update_db_requests', 'Запросы к PostgREST за одно обновление',
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32)
+)
+
+def shard_of(telegram_id: int, workers: int) -> int:
+    """Номер процесса пользователя (BOT_MODE=sharded): все обновления пользователя - в одном процессе"""
+    # telegram_id распределены равномерно, поэтому остатка от деления достаточно и он не зависит от запуска
+    return telegram_id % workers
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных пользователей обрабатываются параллельно, одного пользователя - строго по очереди"""
+
+    def __init__(self, max_concurrent_updates: int, profiler=None):
+        super().__init__(max_concurrent_updates)
+        # SlowUpdateProfiler или None
+        self.profiler = profiler
+        # Ключ пользователя -> [замок, число обновлений в очереди и в работе]
+        self._queues = {}
+
+    @staticmethod
+    def _key(update: object):
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def process_update(self, update: object, coroutine) -> None:
+        key = self._key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._queues.get(key)
+        if entry is None:
+            entry = self._queues[key] = [asyncio.Lock(), 0]
+            USERS_ACTIVE.set(len(self._queues))
+        entry[1] += 1
+        UPDATES_WAITING.inc()
+        waiting = True
+        try:
+            # Сначала очередь пользователя, затем общий лимит: ожидающие не занимают слоты обработки
+            async with entry[0]:
+                UPDATES_WAITING.dec()
+                waiting = False
+                await super().process_update(update, coroutine)
+        finally:
+            if waiting:
+                UPDATES_WAITING.dec()
+                coroutine.close()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._queues[key]
+                USERS_ACTIVE.set(len(self._queues))
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        UPDATES_IN_PROGRESS.inc()
+        profile = self.profiler.start() if self.profiler is not None else None
+        started = time.perf_counter()
+        try:
+            with DbRequestCount() as db_requests:
+                await coroutine
+        finally:
+            elapsed = time.perf_counter() - started
+            UPDATES_IN_PROGRESS.dec()
+            UPDATES_PROCESSED.inc()
+            UPDATE_DURATION.observe(elapsed)
+            UPDATE_DB_REQUESTS.observe(db_requests.count)
+            if profile is not None:
+                self.profiler.stop(profile, elapsed, getattr(update, 'update_id', None))
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import uuid
+
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_IN_MEMORY = metrics.gauge('bot_sessions_in_memory', 'Сессии в памяти процесса')
+SESSIONS_TABLE_ROWS = metrics.gauge('request_sessions_rows', 'Строки в таблице request_sessions')
+SESSIONS_PURGED = metrics.counter('request_sessions_purged_total', 'Удаленные брошенные сессии')
+
+# Поля сессии, которые хранятся в таблице request_sessions
+# id генерируется при старте сессии и служит ключом идемпотентности заявки (или несоответствия)
+# Остальные ключи сессии (например, media_group_id альбома) живут только в памяти
+SESSION_FIELDS = (
+    'id',
+    'transformer_type',
+    'workshop',
+    'product_type',
+    'drawing_number',
+    'product_number',
+    'current_step',
+    'request_id',
+    'description',
+    'photos'
+)
+
+class SessionStore:
+    """Сессии мастера в памяти процесса с отложенной записью в request_sessions"""
+
+    def __init__(self, database, ttl: float, max_size: int, flush_interval: float,
+                 max_age: int, sweep_interval: float, owns=None):
+        self.db = database
+        # owns(telegram_id) - сессия этого процесса (None - все сессии)
+        self.owns = owns
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._cache = TTLCache(max_size, ttl)
+        self._dirty = set()
+        self._persisted = set()
+        # Завершенные сессии, чьи строки еще надо удалить из request_sessions (удаляет flush)
+        self._finished = set()
+        # Сессии, которые сейчас записывает flush
+        self._flushing = set()
+        self._flush_lock = asyncio.Lock()
+        self._finished_event = asyncio.Event()
+        self._tasks = []
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, telegram_id: int):
+        """Получить сессию пользователя (или None)"""
+        return self._cache.get(telegram_id)
+
+    def start(self, telegram_id: int, **fields) -> dict:
+        """Начать новую сессию, заменив предыдущую"""
+        session = {'telegram_id': telegram_id, **{field: None for field in SESSION_FIELDS}}
+        session['id'] = str(uuid.uuid4())
+        session.update(fields)
+        self._cache.set(telegram_id, session)
+        self._dirty.add(telegram_id)
+        return session
+
+    def update(self, telegram_id: int, **fields) -> dict:
+        """Обновить поля текущей сессии"""
+        session = self._cache.get(telegram_id, count=False)
+        if session is None:
+            return self.start(telegram_id, **fields)
+        session.update(fields)
+        self._cache.set(telegram_id, session)
+        self._dirty.add(telegram_id)
+        return session
+
+    def finish(self, telegram_id: int):
+        """Завершить сессию без похода в БД: строку, если она есть или пишется сейчас, удалит фоновая задача"""
+        self._cache.pop(telegram_id)
+        self._dirty.discard(telegram_id)
+        if telegram_id in self._persisted or telegram_id in self._flushing:
+            self._persisted.discard(telegram_id)
+            self._finished.add(telegram_id)
+            self._finished_event.set()
+
+    async def flush(self):
+        """Записать измененные сессии в БД одним запросом и удалить строки завершенных"""
+        async with self._flush_lock:
+            await self._save_dirty()
+            await self._delete_finished()
+
+    async def _save_dirty(self):
+        self._cache.purge_expired()
+        rows = []
+        for telegram_id in list(self._dirty):
+            session = self._cache.get(telegram_id, count=False)
+            if session is not None:
+                rows.append({'telegram_id': telegram_id, **{field: session.get(field) for field in SESSION_FIELDS}})
+        self._dirty.clear()
+        if not rows:
+            return
+        saved = {row['telegram_id'] for row in rows}
+        # Новая строка заменяет строку завершенной ранее сессии того же пользователя
+        self._finished -= saved
+        self._flushing = saved
+        try:
+            await self.db.save_sessions(rows)
+        except Exception as e:
+            # Вернем в очередь на запись сессии, не завершенные за время попытки
+            self._dirty.update(saved - self._finished)
+            logger.error("Error flushing sessions: %s", e)
+        else:
+            # Завершенные во время записи уже в _finished: их строки удалим ниже
+            self._persisted.update(saved - self._finished)
+        finally:
+            self._flushing = set()
+
+    async def _delete_finished(self):
+        if not self._finished:
+            return
+        finished = list(self._finished)
+        try:
+            await self.db.delete_sessions(finished)
+        except Exception as e:
+            logger.error("Error deleting finished sessions: %s", e)
+        else:
+            self._finished.difference_update(finished)
+
+    async def load(self):
+        """Восстановить незавершенные сессии после перезапуска"""
+        response = await self.db.get_sessions()
+        restored = 0
+        for row in response.data:
+            telegram_id = row['telegram_id']
+            if self.owns is not None and not self.owns(telegram_id):
+                continue
+            restored += 1
+            self._cache.set(telegram_id, {'telegram_id': telegram_id, **{field: row.get(field) for field in SESSION_FIELDS}})
+            self._persisted.add(telegram_id)
+        logger.info("Restored %s sessions", restored)
+
+    async def sweep(self):
+        """Удалить устаревшие сессии из памяти и брошенные строки из БД"""
+        self._cache.purge_expired()
+        self._persisted.intersection_update(key for key, _ in self._cache.items())
+        SESSIONS_IN_MEMORY.set(len(self._cache))
+        try:
+            purged = (await self.db.purge_sessions(self.max_age)).data or 0
+            SESSIONS_PURGED.inc(purged)
+            rows = (await self.db.count_sessions()).count or 0
+            SESSIONS_TABLE_ROWS.set(rows)
+            logger.info("Purged %s stale sessions, %s left in request_sessions", purged, rows)
+        except Exception as e:
+            logger.error("Error purging sessions: %s", e)
+
+    async def _reap(self):
+        # Строки завершенных сессий удаляются сразу в фоне, чтобы после перезапуска они не ожили
+        while True:
+            await self._finished_event.wait()
+            self._finished_event.clear()
+            async with self._flush_lock:
+                await self._delete_finished()
+            if self._finished:
+                # БД недоступна: следующая попытка не раньше интервала записи
+                await asyncio.sleep(self.flush_interval)
+
+    async def _every(self, interval: float, job):
+        while True:
+            await asyncio.sleep(interval)
+            await job()
+
+    def start_background(self):
+        """Запустить фоновую запись и очистку сессий"""
+        self._tasks = [
+            asyncio.create_task(self._every(self.flush_interval, self.flush)),
+            asyncio.create_task(self._every(self.sweep_interval, self.sweep)),
+            asyncio.create_task(self._reap())
+        ]
+
+    async def stop(self):
+        """Остановить фоновые задачи и сохранить оставшиеся сессии"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
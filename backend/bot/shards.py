@@ -0,0 +1,211 @@
+"""
+НЕСКОЛЬКО ПРОЦЕССОВ БОТА: ВХОДНОЙ WEBHOOK РАЗДАЕТ ОБНОВЛЕНИЯ ПРОЦЕССАМ ПО TELEGRAM_ID
+
+Входной процесс (BOT_MODE=sharded) принимает webhook Telegram и пересылает обновление
+процессу telegram_id % WORKERS. Процессы (BOT_MODE=worker) - обычный бот в режиме webhook
+на 127.0.0.1, у каждого свой журнал заявок; шаги мастера пользователя идут в одном процессе.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import subprocess
+import sys
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+import metrics
+from bot.scheduler import shard_of
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+UPDATES_FORWARDED = metrics.counter('front_updates_forwarded_total', 'Обновления, переданные процессам')
+UPDATES_UNDELIVERED = metrics.counter('front_updates_undelivered_total', 'Обновления, не принятые процессом (Telegram повторит)')
+WORKERS_RESTARTED = metrics.counter('front_workers_restarted_total', 'Перезапуски упавших процессов')
+
+# Каталог backend: процессы запускаются как python -m bot.core
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Как часто проверять, живы ли процессы (секунды)
+WATCH_INTERVAL = 5
+
+def update_user_id(data: dict):
+    """telegram_id из JSON обновления без разбора в Update: отправитель, иначе чат (как у PerUserUpdateProcessor)"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user is not None:
+            return user['id']
+        chat = value.get('chat')
+        if chat is not None:
+            return chat['id']
+    return None
+
+def worker_outbox_path(index: int) -> str:
+    """Свой SQLite-журнал заявок у каждого процесса: outbox.sqlite3 -> outbox-0.sqlite3"""
+    root, ext = os.path.splitext(settings.OUTBOX_PATH)
+    return f"{root}-{index}{ext}"
+
+class WorkerPool:
+    """Процессы BOT_MODE=worker: запуск, перезапуск упавших и остановка"""
+
+    def __init__(self, workers: int, base_port: int):
+        self.workers = workers
+        self.base_port = base_port
+        self.processes = [None] * workers
+
+    def url(self, index: int) -> str:
+        return f"http://127.0.0.1:{self.base_port + index}"
+
+    def _spawn(self, index: int) -> subprocess.Popen:
+        env = {
+            **os.environ,
+            'BOT_MODE': 'worker',
+            'WORKERS': str(self.workers),
+            'WORKER_INDEX': str(index),
+            'WEBHOOK_HOST': '127.0.0.1',
+            'WEBHOOK_PORT': str(self.base_port + index),
+            'OUTBOX_PATH': worker_outbox_path(index)
+        }
+        return subprocess.Popen([sys.executable, '-m', 'bot.core'], cwd=BACKEND_DIR, env=env)
+
+    def _check_outboxes(self):
+        # Журналы процессов с номером >= WORKERS (после уменьшения WORKERS) никто не допишет в БД
+        root, ext = os.path.splitext(settings.OUTBOX_PATH)
+        owned = {worker_outbox_path(index) for index in range(self.workers)}
+        for path in glob.glob(f"{glob.escape(root)}-*{ext}"):
+            if path not in owned:
+                logger.warning("Outbox %s is not owned by any worker, start with more WORKERS to flush it", path)
+
+    def start(self):
+        self._check_outboxes()
+        for index in range(self.workers):
+            self.processes[index] = self._spawn(index)
+        logger.info("Started %s workers on ports %s-%s", self.workers, self.base_port, self.base_port + self.workers - 1)
+
+    async def watch(self):
+        """Перезапускать упавшие процессы"""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    logger.error("Worker %s exited with code %s, restarting", index, process.returncode)
+                    WORKERS_RESTARTED.inc()
+                    self.processes[index] = self._spawn(index)
+
+    def stop(self, timeout: float):
+        """SIGTERM всем процессам: каждый дописывает сессии и журнал заявок и завершается"""
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.error("Worker %s did not stop in %s s, killing", index, timeout)
+                process.kill()
+
+def create_front_app(token: str, pool: WorkerPool) -> FastAPI:
+    """Входное FastAPI-приложение: webhook Telegram и пересылка обновлений процессам"""
+    client = httpx.AsyncClient(
+        timeout=10,
+        limits=httpx.Limits(max_connections=pool.workers * 20, max_keepalive_connections=pool.workers * 20)
+    )
+    forward_headers = {'Content-Type': 'application/json'}
+    if settings.WEBHOOK_SECRET:
+        forward_headers['X-Telegram-Bot-Api-Secret-Token'] = settings.WEBHOOK_SECRET
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        pool.start()
+        watcher = asyncio.create_task(pool.watch())
+        if settings.WEBHOOK_URL:
+            # Bot без Application: входному процессу не нужны обработчики
+            from telegram import Bot, Update
+
+            async with Bot(token) as bot:
+                await bot.set_webhook(
+                    url=settings.WEBHOOK_URL.rstrip('/') + settings.WEBHOOK_PATH,
+                    secret_token=settings.WEBHOOK_SECRET or None,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            logger.info("Webhook set to %s%s", settings.WEBHOOK_URL, settings.WEBHOOK_PATH)
+        yield
+        watcher.cancel()
+        await client.aclose()
+        await asyncio.to_thread(pool.stop, settings.WORKER_STOP_TIMEOUT)
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.post(settings.WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        """Передать обновление процессу пользователя; если процесс недоступен - не 200, и Telegram повторит"""
+        if settings.WEBHOOK_SECRET and \
+                request.headers.get('X-Telegram-Bot-Api-Secret-Token') != settings.WEBHOOK_SECRET:
+            raise HTTPException(status_code=403)
+        body = await request.body()
+        telegram_id = update_user_id(json.loads(body))
+        index = shard_of(telegram_id, pool.workers) if telegram_id is not None else 0
+        try:
+            response = await client.post(pool.url(index) + settings.WEBHOOK_PATH, content=body, headers=forward_headers)
+        except httpx.HTTPError as e:
+            UPDATES_UNDELIVERED.inc(worker=index)
+            logger.warning("Worker %s is unavailable: %s", index, e)
+            return Response(status_code=503)
+        if response.status_code != 200:
+            UPDATES_UNDELIVERED.inc(worker=index)
+        else:
+            UPDATES_FORWARDED.inc(worker=index)
+        return Response(status_code=response.status_code)
+
+    async def proxy(url: str, request: Request):
+        # Ответ (например, выгрузка заявок) отдается потоком, не целиком из памяти
+        upstream = await client.send(
+            client.build_request('GET', url, params=request.query_params,
+                                 headers={'Authorization': request.headers.get('Authorization', '')}),
+            stream=True
+        )
+        headers = {
+            name: value for name, value in upstream.headers.items()
+            if name in ('content-type', 'content-disposition', 'content-length')
+        }
+        return StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code, headers=headers,
+                                 background=BackgroundTask(upstream.aclose))
+
+    @app.get('/api/{path:path}')
+    async def api(path: str, request: Request):
+        """API работает с БД, а не с памятью процесса: его отдает любой процесс, берем первый"""
+        return await proxy(f"{pool.url(0)}/api/{path}", request)
+
+    @app.get('/workers/{index}/metrics')
+    async def worker_metrics(index: int, request: Request):
+        """Метрики процесса index (у каждого процесса свои)"""
+        if not 0 <= index < pool.workers:
+            raise HTTPException(status_code=404)
+        return await proxy(f"{pool.url(index)}/metrics", request)
+
+    @app.get('/metrics')
+    async def front_metrics():
+        """Метрики входного процесса"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @app.get('/health')
+    async def health():
+        return {'status': 'ok', 'workers': sum(process is not None and process.poll() is None for process in pool.processes)}
+
+    return app
+
+def run_sharded(token: str):
+    """Запуск входного процесса; процессы-обработчики он запускает и останавливает сам"""
+    import uvicorn
+
+    pool = WorkerPool(settings.WORKERS, settings.WORKER_BASE_PORT)
+    uvicorn.run(create_front_app(token, pool), host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
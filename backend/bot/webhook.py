@@ -0,0 +1,106 @@
+import hmac
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from telegram import Update
+
+import metrics
+from config import settings
+from reports import MEDIA_TYPES, export_requests, parse_period, xlsx_available
+
+logger = logging.getLogger(__name__)
+
+def require_api_token(request: Request):
+    """Доступ к /api только с токеном API_TOKEN (без него API выключено)"""
+    token = request.headers.get('Authorization', '')
+    if not settings.API_TOKEN or not hmac.compare_digest(token, f"Bearer {settings.API_TOKEN}"):
+        raise HTTPException(status_code=403)
+
+def create_app(bot) -> FastAPI:
+    """FastAPI-приложение, принимающее обновления Telegram через webhook"""
+    application = bot.application
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # post_init/post_stop/post_shutdown вызываются только в run_polling/run_webhook, поэтому зовем их сами
+        await application.initialize()
+        await bot.on_startup(application)
+        # Процесс BOT_MODE=worker получает обновления от входного процесса, webhook ставит тот
+        if settings.WEBHOOK_URL and settings.BOT_MODE == 'webhook':
+            await application.bot.set_webhook(
+                url=settings.WEBHOOK_URL.rstrip('/') + settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info("Webhook set to %s%s", settings.WEBHOOK_URL, settings.WEBHOOK_PATH)
+        await application.start()
+        yield
+        await application.stop()
+        await bot.on_stop(application)
+        await application.shutdown()
+        await bot.on_shutdown(application)
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.post(settings.WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        """Принять обновление и сразу ответить 200; обработка идет в очереди Application"""
+        if settings.WEBHOOK_SECRET and \
+                request.headers.get('X-Telegram-Bot-Api-Secret-Token') != settings.WEBHOOK_SECRET:
+            raise HTTPException(status_code=403)
+        update = Update.de_json(await request.json(), application.bot)
+        await application.update_queue.put(update)
+        return Response(status_code=200)
+
+    @app.get('/api/nonconformances/{nonconformance_id}/photos/{index}/thumbnail')
+    async def nonconformance_thumbnail(nonconformance_id: uuid.UUID, index: int, request: Request):
+        """Миниатюра фото несоответствия (при первом запросе скачивается из Telegram в дисковый кэш)"""
+        require_api_token(request)
+        rows = (await bot.db.get_nonconformance(str(nonconformance_id))).data
+        if not rows or not 0 <= index < len(rows[0]['photos']):
+            raise HTTPException(status_code=404)
+        path = await bot.thumbnails.get(rows[0]['photos'][index])
+        return FileResponse(path, media_type='image/jpeg')
+
+    @app.get('/api/exports/requests')
+    async def export_requests_file(request: Request, period: str = None, format: str = 'csv',
+                                   workshop: str = None, status: str = None):
+        """Выгрузка заявок за период (ГГГГ-ММ или ГГГГ-ММ-ДД) файлом CSV/XLSX"""
+        require_api_token(request)
+        if format not in MEDIA_TYPES or (format == 'xlsx' and not xlsx_available()):
+            raise HTTPException(status_code=400, detail='Unsupported format')
+        try:
+            date_from, date_to = parse_period(period, settings.EXPORT_TIMEZONE)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Period must be YYYY-MM or YYYY-MM-DD')
+        
+        path, _ = await export_requests(
+            bot.db, format, date_from, date_to,
+            workshop=workshop,
+            status=status,
+            chunk_size=settings.EXPORT_CHUNK_SIZE,
+            directory=settings.EXPORT_DIR
+        )
+        # Файл отдается потоком с диска и удаляется после ответа
+        return FileResponse(
+            path,
+            media_type=MEDIA_TYPES[format],
+            filename=f"requests_{date_from:%Y-%m-%d}_{date_to:%Y-%m-%d}.{format}",
+            background=BackgroundTask(os.remove, path)
+        )
+
+    @app.get('/metrics')
+    async def metrics_endpoint():
+        """Метрики процесса в текстовом формате Prometheus"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @app.get('/health')
+    async def health():
+        return {'status': 'ok'}
+
+    return app
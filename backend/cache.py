@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """LRU-кэш с ограничением размера и временем жизни записей"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+    
+    def get(self, key, default=None, count: bool = True):
+        """Получить значение, если оно есть и не устарело"""
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+    
+    def set(self, key, value):
+        """Сохранить значение, вытесняя самые старые записи при переполнении"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        """Удалить значение"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+    
+    def clear(self):
+        """Очистить кэш"""
+        self._data.clear()
+    
+    def purge_expired(self) -> int:
+        """Удалить устаревшие записи, вернуть их количество"""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+    
+    def items(self):
+        """Актуальные пары (ключ, значение)"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
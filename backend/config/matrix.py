@@ -1,6 +1,7 @@
 """
 МАТРИЧНАЯ СТРУКТУРА ДАННЫХ ДЛЯ СИСТЕМЫ ЗАЯВОК ОТК
 """
+from types import MappingProxyType
 
 # 1. ТИПЫ ТРАНСФОРМАТОРОВ
 TRANSFORMER_TYPES = {
@@ -70,6 +71,59 @@ PRODUCT_REQUIRES_NUMBER = {
     "housed_tfm": True
 }
 
+# 7. ОБРАТНЫЕ ИНДЕКСЫ "НАЗВАНИЕ КНОПКИ -> КЛЮЧ" (строятся один раз при импорте)
+TRANSFORMER_BY_LABEL = MappingProxyType({label: key for key, label in TRANSFORMER_TYPES.items()})
+WORKSHOP_BY_LABEL = MappingProxyType({label: key for key, label in WORKSHOPS.items()})
+PRODUCT_BY_LABEL = MappingProxyType({label: key for key, label in PRODUCTS.items()})
+
+_LABEL_INDEXES = MappingProxyType({
+    'transformer': TRANSFORMER_BY_LABEL,
+    'workshop': WORKSHOP_BY_LABEL,
+    'product': PRODUCT_BY_LABEL
+})
+
+# 8. ДОПУСТИМЫЕ СОЧЕТАНИЯ (множества для проверки за O(1))
+TRANSFORMER_WORKSHOP_PAIRS = frozenset(
+    (transformer, workshop)
+    for transformer, workshops in TRANSFORMER_WORKSHOPS.items()
+    for workshop in workshops
+)
+WORKSHOP_PRODUCT_PAIRS = frozenset(
+    (workshop, product)
+    for workshop, products in WORKSHOP_PRODUCTS.items()
+    for product in products
+)
+VALID_SELECTIONS = frozenset(
+    (transformer, workshop, product)
+    for transformer, workshop in TRANSFORMER_WORKSHOP_PAIRS
+    for product in WORKSHOP_PRODUCTS.get(workshop, [])
+)
+
+# 9. СТАТУСЫ ЗАЯВОК И ПЕРЕХОДЫ ОТК: действие -> (из статуса, в статус)
+REQUEST_STATUSES = {
+    "planned": "Планируется",
+    "in_progress": "На приемке",
+    "success": "Принята",
+    "rejected": "Отклонена"
+}
+
+STATUS_ICONS = {
+    "planned": "🟡",
+    "in_progress": "🔵",
+    "success": "🟢",
+    "rejected": "🔴"
+}
+
+STATUS_TRANSITIONS = MappingProxyType({
+    "claim": ("planned", "in_progress"),
+    "accept": ("in_progress", "success"),
+    "reject": ("in_progress", "rejected")
+})
+
+def resolve_label(catalog: str, label: str):
+    """Найти ключ по названию кнопки в справочнике 'transformer', 'workshop' или 'product' (None, если не найден)"""
+    return _LABEL_INDEXES[catalog].get(label.strip())
+
 def get_workshops_for_transformer(transformer_type: str) -> list:
     """Получить участки доступные для типа трансформатора"""
     return TRANSFORMER_WORKSHOPS.get(transformer_type, [])
@@ -82,12 +136,20 @@ def is_product_number_required(product: str) -> bool:
     """Требуется ли номер изделия для данного продукта"""
     return PRODUCT_REQUIRES_NUMBER.get(product, False)
 
+def is_workshop_available(transformer_type: str, workshop: str) -> bool:
+    """Доступен ли участок для типа трансформатора"""
+    return (transformer_type, workshop) in TRANSFORMER_WORKSHOP_PAIRS
+
 def validate_selection(transformer_type: str, workshop: str, product: str) -> tuple[bool, str]:
     """Валидация выбора пользователя"""
-    if workshop not in get_workshops_for_transformer(transformer_type):
-        return False, "❌ Этот участок недоступен для выбранного типа трансформатора"
+    if (transformer_type, workshop, product) in VALID_SELECTIONS:
+        return True, "✅ Выбор корректен"
     
-    if product not in get_products_for_workshop(workshop):
-        return False, "❌ Это изделие недоступно для выбранного участка"
+    if not is_workshop_available(transformer_type, workshop):
+        return False, "❌ Этот участок недоступен для выбранного типа трансформатора"
     
-    return True, "✅ Выбор корректен"
+    return False, "❌ Это изделие недоступно для выбранного участка"
+
+def status_label(status: str) -> str:
+    """Статус заявки со значком для сообщений"""
+    return f"{STATUS_ICONS.get(status, '⚪')} {REQUEST_STATUSES.get(status, status)}"
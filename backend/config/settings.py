@@ -0,0 +1,96 @@
+"""
+НАСТРОЙКИ БОТА (ЧИТАЮТСЯ ИЗ ПЕРЕМЕННЫХ ОКРУЖЕНИЯ)
+"""
+import os
+
+# 1. СЕССИИ СОЗДАНИЯ ЗАЯВОК (хранятся в памяти процесса)
+SESSION_TTL = int(os.getenv('SESSION_TTL', '3600'))
+SESSION_MAX_SIZE = int(os.getenv('SESSION_MAX_SIZE', '10000'))
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', '30'))
+# Брошенные сессии удаляются из request_sessions, если не обновлялись SESSION_MAX_AGE секунд
+SESSION_MAX_AGE = int(os.getenv('SESSION_MAX_AGE', str(SESSION_TTL)))
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '600'))
+
+# 2. КЭШ ПРОФИЛЕЙ ПОЛЬЗОВАТЕЛЕЙ (telegram_id -> users)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '5000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '600'))
+
+# 3. РЕЖИМ РАБОТЫ: 'polling' (getUpdates), 'webhook' (FastAPI + uvicorn)
+# или 'sharded' (webhook раздает обновления процессам BOT_MODE=worker, см. раздел 13)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Сколько обновлений обрабатывается одновременно (обновления одного пользователя - всегда по очереди)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '16'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+
+# 4. КЭШ ОТВЕТА "📊 Статистика" (секунды)
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '60'))
+
+# 5. ЛОКАЛЬНЫЙ ЖУРНАЛ ЗАЯВОК (outbox): заявки пишутся в SQLite и пачками уходят в БД
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.sqlite3')
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv('OUTBOX_FLUSH_INTERVAL', '0.5'))
+OUTBOX_MAX_BACKOFF = float(os.getenv('OUTBOX_MAX_BACKOFF', '60'))
+
+# 6. ОТСЕВ ПОВТОРОВ: update_id помним DEDUP_UPDATE_TTL секунд, одинаковые сообщения склеиваем в окне DEDUP_MESSAGE_WINDOW
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', '50000'))
+DEDUP_UPDATE_TTL = float(os.getenv('DEDUP_UPDATE_TTL', '86400'))
+DEDUP_MESSAGE_WINDOW = float(os.getenv('DEDUP_MESSAGE_WINDOW', '2'))
+
+# 7. ПАКЕТНАЯ ПОДАЧА ЗАЯВОК (список строк или CSV-файл)
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', '500'))
+BULK_MAX_FILE_SIZE = int(os.getenv('BULK_MAX_FILE_SIZE', str(1024 * 1024)))
+
+# 8. УВЕДОМЛЕНИЯ КОНТРОЛЕРОВ ОТК (лимиты Telegram: ~30 сообщений/с всего и ~1/с в один чат)
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '25'))
+NOTIFY_CHAT_INTERVAL = float(os.getenv('NOTIFY_CHAT_INTERVAL', '1'))
+NOTIFY_DIGEST_WINDOW = float(os.getenv('NOTIFY_DIGEST_WINDOW', '5'))
+INSPECTORS_CACHE_TTL = float(os.getenv('INSPECTORS_CACHE_TTL', '300'))
+# Сколько секунд при остановке ждать отправки накопленных уведомлений
+NOTIFY_SHUTDOWN_TIMEOUT = float(os.getenv('NOTIFY_SHUTDOWN_TIMEOUT', '10'))
+
+# 9. НЕСООТВЕТСТВИЯ: фото хранятся ссылками file_id, миниатюры для API - в дисковом кэше до THUMBNAIL_CACHE_SIZE байт
+NONCONFORMANCE_MAX_PHOTOS = int(os.getenv('NONCONFORMANCE_MAX_PHOTOS', '10'))
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', 'thumbnails')
+THUMBNAIL_CACHE_SIZE = int(os.getenv('THUMBNAIL_CACHE_SIZE', str(50 * 1024 * 1024)))
+# Токен для /api (заголовок Authorization: Bearer ...); пустой - API выключено
+API_TOKEN = os.getenv('API_TOKEN', '')
+
+# 10. ВЫГРУЗКА ЗАЯВОК (CSV/XLSX): порции по EXPORT_CHUNK_SIZE строк, границы периода - в часовом поясе завода
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+EXPORT_TIMEZONE = os.getenv('EXPORT_TIMEZONE', 'Europe/Moscow')
+EXPORT_DIR = os.getenv('EXPORT_DIR') or None
+# Лимит Telegram на отправку документа ботом
+EXPORT_MAX_DOCUMENT_SIZE = int(os.getenv('EXPORT_MAX_DOCUMENT_SIZE', str(50 * 1024 * 1024)))
+
+# 11. ПОДСКАЗКИ НОМЕРОВ ЧЕРТЕЖЕЙ (inline-режим: @бот и начало номера)
+DRAWING_MIN_PREFIX = int(os.getenv('DRAWING_MIN_PREFIX', '3'))
+DRAWING_SUGGESTIONS = int(os.getenv('DRAWING_SUGGESTIONS', '10'))
+# Загруженный список номеров перечитывается из БД не реже раза в DRAWING_INDEX_TTL секунд
+# (новые номера своего процесса добавляются сразу, других процессов BOT_MODE=worker - при перечитывании)
+DRAWING_INDEX_TTL = float(os.getenv('DRAWING_INDEX_TTL', '300'))
+
+# 12. ЗАМЕРЫ И ЖУРНАЛ: /metrics в формате Prometheus, профиль медленных обновлений по желанию
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# В режиме polling /metrics отдает отдельный сервер на METRICS_PORT (0 - выключен); в режиме webhook - FastAPI
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Доля обновлений под cProfile (0 - профилировщик выключен); в журнал пишутся профили обновлений дольше PROFILE_SLOW_UPDATE секунд
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_UPDATE = float(os.getenv('PROFILE_SLOW_UPDATE', '1'))
+
+# 13. НЕСКОЛЬКО ПРОЦЕССОВ (BOT_MODE=sharded): пользователь закреплен за процессом telegram_id % WORKERS
+WORKERS = int(os.getenv('WORKERS', str(os.cpu_count() or 1)))
+# Номер процесса задает входной процесс; процессы слушают 127.0.0.1:WORKER_BASE_PORT + номер
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', '8100'))
+# Сколько ждать завершения процессов при остановке (секунды)
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', '30'))
+
+# 14. ПОДКЛЮЧЕНИЕ К БД (PostgREST Supabase): общий пул keep-alive соединений процесса и таймаут запроса (секунды)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))
+DB_POOL_KEEPALIVE = int(os.getenv('DB_POOL_KEEPALIVE', '20'))
+DB_TIMEOUT = float(os.getenv('DB_TIMEOUT', '10'))
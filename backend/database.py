@@ -1,51 +1,299 @@
 import os
-from supabase import create_client
+import httpx
+from postgrest import AsyncPostgrestClient
 
-class Database:
-    def __init__(self):
-        self.supabase = create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
+import metrics
+from cache import TTLCache
+from config import settings
+from instrumentation import count_db_request, instrument_methods
+
+DB_CALL_DURATION = metrics.histogram('db_call_duration_seconds', 'Время метода AsyncDatabase (с кэшем и повторами)')
+DB_CALL_ERRORS = metrics.counter('db_call_errors_total', 'Исключения в методах AsyncDatabase')
+USER_CACHE_HITS = metrics.counter('user_cache_hits_total', 'Попадания в кэш профилей пользователей')
+USER_CACHE_MISSES = metrics.counter('user_cache_misses_total', 'Промахи кэша профилей пользователей')
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST-клиент с общим пулом keep-alive соединений"""
+    
+    def __init__(self, base_url: str, transport: httpx.AsyncBaseTransport = None, **kwargs):
+        # transport - свой HTTP-транспорт (например, PostgREST в памяти для замеров)
+        self._transport = transport
+        super().__init__(base_url, **kwargs)
+    
+    def create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self._transport,
+            # Каждый HTTP-запрос учитывается в счетчике запросов обновления
+            event_hooks={'request': [count_db_request]},
+            limits=httpx.Limits(
+                max_connections=settings.DB_POOL_SIZE,
+                max_keepalive_connections=settings.DB_POOL_KEEPALIVE,
+                keepalive_expiry=30
+            )
+        )
+
+@instrument_methods(DB_CALL_DURATION, DB_CALL_ERRORS, 'method')
+class AsyncDatabase:
+    """Доступ к БД через PostgREST без блокировки event loop"""
+    
+    def __init__(self, url: str = None, key: str = None, transport: httpx.AsyncBaseTransport = None):
+        url = url or os.getenv('SUPABASE_URL')
+        key = key or os.getenv('SUPABASE_KEY')
+        if not url or not key:
+            raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+        self.client = PooledPostgrestClient(
+            f"{url}/rest/v1",
+            transport=transport,
+            headers={
+                'apikey': key,
+                'Authorization': f"Bearer {key}",
+                'Accept': 'application/json',
+                'Content-Type': 'application/json'
+            },
+            timeout=settings.DB_TIMEOUT
         )
+        # Профили почти не меняются: кэшируем ответ по telegram_id
+        self.users_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+    
+    async def close(self):
+        """Закрыть пул соединений"""
+        await self.client.aclose()
     
-    def create_user(self, user_data: dict):
+    async def create_user(self, user_data: dict):
         """Создание/обновление пользователя"""
-        return self.supabase.table('users').upsert(user_data).execute()
+        try:
+            return await self.client.table('users')\
+                .upsert(user_data, on_conflict='telegram_id')\
+                .execute()
+        finally:
+            self.users_cache.pop(user_data['telegram_id'])
+    
+    async def get_user_by_telegram_id(self, telegram_id: int):
+        """Получить пользователя по Telegram ID (через кэш)"""
+        response = self.users_cache.get(telegram_id)
+        if response is not None:
+            USER_CACHE_HITS.inc()
+            return response
+        
+        USER_CACHE_MISSES.inc()
+        response = await self.client.table('users').select('*').eq('telegram_id', telegram_id).execute()
+        # Незарегистрированных не кэшируем, чтобы регистрация была видна сразу
+        if response.data:
+            self.users_cache.set(telegram_id, response)
+        return response
     
-    def get_user_by_telegram_id(self, telegram_id: int):
-        """Получить пользователя по Telegram ID"""
-        return self.supabase.table('users').select('*').eq('telegram_id', telegram_id).execute()
+    def get_cached_user(self, telegram_id: int):
+        """Профиль пользователя, только если он уже в кэше (без запроса к БД)"""
+        response = self.users_cache.get(telegram_id, count=False)
+        return response.data[0] if response is not None else None
+    
+    async def get_user_ids(self, telegram_ids: list) -> dict:
+        """telegram_id -> users.id: из кэша профилей, остальные одним запросом"""
+        user_ids, missing = {}, []
+        for telegram_id in telegram_ids:
+            response = self.users_cache.get(telegram_id)
+            if response is not None:
+                user_ids[telegram_id] = response.data[0]['id']
+            else:
+                missing.append(telegram_id)
+        if missing:
+            response = await self.client.table('users')\
+                .select('id,telegram_id')\
+                .in_('telegram_id', missing)\
+                .execute()
+            user_ids.update((row['telegram_id'], row['id']) for row in response.data)
+        return user_ids
+    
+    async def get_inspectors(self, workshop: str):
+        """Контролеры ОТК, подписанные на участок"""
+        return await self.client.table('users')\
+            .select('telegram_id')\
+            .eq('role', 'inspector')\
+            .eq('workshop', workshop)\
+            .execute()
     
-    def create_request(self, request_data: dict):
+    async def create_request(self, request_data: dict):
         """Создание новой заявки"""
-        return self.supabase.table('requests').insert(request_data).execute()
+        return await self.client.table('requests').insert(request_data).execute()
     
-    def get_user_requests(self, user_id: str, limit: int = 10):
+    async def create_requests(self, requests: list):
+        """Создание пачки заявок одним запросом; повторы по idempotency_key пропускаются"""
+        return await self.client.table('requests')\
+            .upsert(requests, on_conflict='idempotency_key', ignore_duplicates=True)\
+            .execute()
+    
+    async def get_user_requests(self, user_id: str, limit: int = 10):
         """Получить заявки пользователя"""
-        return self.supabase.table('requests')\
+        return await self.client.table('requests')\
             .select('*')\
             .eq('master_id', user_id)\
             .order('created_at', desc=True)\
             .limit(limit)\
             .execute()
     
-    def save_session(self, session_data: dict):
+    async def get_master_requests(self, telegram_id: int, cursor: tuple = None,
+                                  direction: str = 'older', limit: int = 5):
+        """Страница заявок мастера по Telegram ID одним вызовом; cursor - (created_at, id)"""
+        created_at, request_id = cursor if cursor else (None, None)
+        return await self.client.rpc('get_master_requests', {
+            'p_telegram_id': telegram_id,
+            'p_cursor_created_at': created_at,
+            'p_cursor_id': request_id,
+            'p_direction': direction,
+            'p_limit': limit
+        }).execute()
+    
+    async def get_inspector_queue(self, workshop: str, cursor: tuple = None, limit: int = 10):
+        """Страница очереди участка (заявки 'planned' от старых к новым); cursor - (created_at, id)"""
+        created_at, request_id = cursor if cursor else (None, None)
+        return await self.client.rpc('get_inspector_queue', {
+            'p_workshop': workshop,
+            'p_cursor_created_at': created_at,
+            'p_cursor_id': request_id,
+            'p_limit': limit
+        }).execute()
+    
+    async def get_inspector_claims(self, inspector_id: str, limit: int = 10):
+        """Заявки, взятые контролером и еще не закрытые"""
+        return await self.client.table('requests')\
+            .select('*')\
+            .eq('inspector_id', inspector_id)\
+            .eq('status', 'in_progress')\
+            .order('created_at')\
+            .order('id')\
+            .limit(limit)\
+            .execute()
+    
+    async def transition_request(self, request_id: str, telegram_id: int, action: str):
+        """Сменить статус заявки действием контролера; пустой ответ - заявку уже изменил кто-то другой"""
+        return await self.client.rpc('transition_request', {
+            'p_request_id': request_id,
+            'p_telegram_id': telegram_id,
+            'p_action': action
+        }).execute()
+    
+    async def get_request_with_master(self, request_id: str):
+        """Заявка, кто и в каком статусе ее ведет, и Telegram ID ее мастера"""
+        return await self.client.table('requests')\
+            .select('id,workshop,product_type,drawing_number,product_number,status,inspector_id,'
+                    'master:users!master_id(telegram_id)')\
+            .eq('id', request_id)\
+            .execute()
+    
+    async def create_nonconformance(self, nonconformance: dict):
+        """Записать несоответствие; повтор с тем же id пропускается"""
+        return await self.client.table('nonconformances')\
+            .upsert(nonconformance, on_conflict='id', ignore_duplicates=True)\
+            .execute()
+    
+    async def get_nonconformance(self, nonconformance_id: str):
+        """Несоответствие по id (ссылки на фото)"""
+        return await self.client.table('nonconformances')\
+            .select('id,request_id,photos')\
+            .eq('id', nonconformance_id)\
+            .execute()
+    
+    async def get_master_nonconformances(self, master_id: str, limit: int = 10):
+        """Последние несоответствия по заявкам мастера"""
+        return await self.client.table('nonconformances')\
+            .select('id,description,photos,created_at,requests!inner(drawing_number,product_type,product_number)')\
+            .eq('requests.master_id', master_id)\
+            .order('created_at', desc=True)\
+            .limit(limit)\
+            .execute()
+    
+    async def export_requests_page(self, date_from: str, date_to: str, workshop: str = None,
+                                   status: str = None, cursor: tuple = None, limit: int = 1000):
+        """Порция заявок за период [date_from, date_to) для выгрузки; cursor - (created_at, id)"""
+        created_at, request_id = cursor if cursor else (None, None)
+        return await self.client.rpc('export_requests', {
+            'p_from': date_from,
+            'p_to': date_to,
+            'p_workshop': workshop,
+            'p_status': status,
+            'p_cursor_created_at': created_at,
+            'p_cursor_id': request_id,
+            'p_limit': limit
+        }).execute()
+    
+    async def get_drawing_numbers(self, transformer_type: str, workshop: str, product_type: str,
+                                  after: str = None, limit: int = 1000):
+        """Порция различных номеров чертежей сочетания (по алфавиту после after)"""
+        return await self.client.rpc('get_drawing_numbers', {
+            'p_transformer_type': transformer_type,
+            'p_workshop': workshop,
+            'p_product_type': product_type,
+            'p_after': after,
+            'p_limit': limit
+        }).execute()
+    
+    async def get_request_stats(self):
+        """Сводка заявок по участкам, изделиям и статусам"""
+        return await self.client.table('request_stats')\
+            .select('workshop,product_type,status,total')\
+            .gt('total', 0)\
+            .execute()
+    
+    async def save_session(self, session_data: dict):
         """Сохранить сессию создания заявки"""
-        return self.supabase.table('request_sessions').upsert(session_data).execute()
+        return await self.client.table('request_sessions')\
+            .upsert(session_data, on_conflict='telegram_id')\
+            .execute()
     
-    def get_session(self, telegram_id: int):
+    async def save_sessions(self, sessions: list):
+        """Сохранить несколько сессий одним запросом"""
+        return await self.client.table('request_sessions')\
+            .upsert(sessions, on_conflict='telegram_id', returning='minimal')\
+            .execute()
+    
+    async def get_sessions(self):
+        """Получить все незавершенные сессии"""
+        return await self.client.table('request_sessions')\
+            .select('*')\
+            .order('created_at')\
+            .execute()
+    
+    async def get_session(self, telegram_id: int):
         """Получить сессию пользователя"""
-        return self.supabase.table('request_sessions')\
+        return await self.client.table('request_sessions')\
             .select('*')\
             .eq('telegram_id', telegram_id)\
             .execute()
     
-    def delete_session(self, telegram_id: int):
+    async def delete_session(self, telegram_id: int):
         """Удалить сессию пользователя"""
-        return self.supabase.table('request_sessions')\
+        return await self.client.table('request_sessions')\
             .delete()\
             .eq('telegram_id', telegram_id)\
             .execute()
+    
+    async def delete_sessions(self, telegram_ids: list):
+        """Удалить сессии нескольких пользователей одним запросом"""
+        return await self.client.table('request_sessions')\
+            .delete()\
+            .in_('telegram_id', telegram_ids)\
+            .execute()
+    
+    async def purge_sessions(self, max_age: int):
+        """Удалить брошенные сессии старше max_age секунд, вернуть их количество"""
+        return await self.client.rpc('purge_stale_sessions', {'max_age_seconds': max_age}).execute()
+    
+    async def count_sessions(self):
+        """Количество строк в request_sessions"""
+        return await self.client.table('request_sessions')\
+            .select('id', count='exact')\
+            .limit(1)\
+            .execute()
+
+# Общий экземпляр создается при первом обращении: импорт модуля не требует ключей и не открывает пул соединений
+_db = None
 
-# Глобальный экземпляр базы данных
-db = Database()
+def get_db() -> AsyncDatabase:
+    """Общий экземпляр AsyncDatabase (SUPABASE_URL и SUPABASE_KEY из окружения)"""
+    global _db
+    if _db is None:
+        _db = AsyncDatabase()
+    return _db
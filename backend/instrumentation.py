@@ -0,0 +1,130 @@
+"""
+ЗАМЕРЫ ГОРЯЧЕГО ПУТИ: ВРЕМЯ И ОШИБКИ КОРУТИН, ЗАПРОСЫ К БД НА ОДНО ОБНОВЛЕНИЕ, ПРОФИЛЬ МЕДЛЕННЫХ ОБНОВЛЕНИЙ
+"""
+import asyncio
+import contextvars
+import cProfile
+import inspect
+import io
+import logging
+import pstats
+import random
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DB_REQUESTS = metrics.counter('db_requests_total', 'HTTP-запросы к PostgREST')
+SLOW_UPDATES_PROFILED = metrics.counter('bot_slow_updates_profiled_total', 'Медленные обновления, профиль которых записан в журнал')
+
+# Счетчик запросов к БД текущего обновления (None - вне обработки обновления)
+_db_requests = contextvars.ContextVar('db_requests', default=None)
+
+def timed(callback, histogram: metrics.Histogram, errors: metrics.Counter, label: str, ignore: tuple = ()):
+    """Обертка корутины: время - в histogram, исключения (кроме ignore) - в errors, метка label - имя callback"""
+    name = getattr(callback, '__name__', type(callback).__name__)
+
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except ignore:
+            raise
+        except Exception:
+            errors.inc(**{label: name})
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, **{label: name})
+
+    wrapper.__name__ = wrapper.__qualname__ = name
+    wrapper.__doc__ = callback.__doc__
+    wrapper.__wrapped__ = callback
+    return wrapper
+
+def instrument_methods(histogram: metrics.Histogram, errors: metrics.Counter, label: str):
+    """Декоратор класса: обернуть замером все публичные async-методы"""
+    def decorate(cls):
+        for name, member in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(member):
+                setattr(cls, name, timed(member, histogram, errors, label))
+        return cls
+    return decorate
+
+class DbRequestCount:
+    """Запросы к PostgREST внутри блока with, включая задачи, созданные в нем"""
+
+    def __init__(self):
+        self.count = 0
+        self._token = None
+
+    def __enter__(self):
+        self._token = _db_requests.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _db_requests.reset(self._token)
+
+async def count_db_request(request):
+    """Хук httpx: запрос к PostgREST - в общий счетчик и в счетчик текущего обновления"""
+    DB_REQUESTS.inc()
+    current = _db_requests.get()
+    if current is not None:
+        current.count += 1
+
+class SlowUpdateProfiler:
+    """cProfile для случайной доли обновлений; профиль пишется в журнал, если обновление шло дольше threshold"""
+
+    def __init__(self, threshold: float, sample_rate: float, top: int = 25):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.top = top
+        self._running = False
+
+    def start(self):
+        """Профиль обновления, попавшего в выборку; None - не профилируем"""
+        # Профилировщик в потоке один, поэтому одновременно профилируется одно обновление;
+        # в профиль попадают и чужие обновления, шедшие в event loop в это же время
+        if self._running or random.random() >= self.sample_rate:
+            return None
+        self._running = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile, elapsed: float, update_id=None):
+        profile.disable()
+        self._running = False
+        if elapsed < self.threshold:
+            return
+        SLOW_UPDATES_PROFILED.inc()
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+        logger.warning("Update %s took %.3f s, profile:\n%s", update_id, elapsed, stream.getvalue())
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Отдельный HTTP-сервер /metrics для режима polling (в режиме webhook /metrics отдает FastAPI)"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, content_type, body = '200 OK', metrics.CONTENT_TYPE, metrics.render().encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', b'Not Found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info("Metrics server listening on %s:%s", host, port)
+    return server
@@ -0,0 +1,121 @@
+"""
+МЕТРИКИ ПРОЦЕССА БОТА (СЧЕТЧИКИ, ТЕКУЩИЕ ЗНАЧЕНИЯ, ГИСТОГРАММЫ) И ИХ ВЫВОД В ФОРМАТЕ PROMETHEUS
+"""
+import bisect
+
+REGISTRY = {}
+
+# Content-Type текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Границы корзин времени по умолчанию (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+class Metric:
+    kind = 'untyped'
+    
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        # Ключ - кортеж пар (метка, значение)
+        self.values = {}
+    
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+    
+    def get(self, **labels):
+        """Текущее значение для набора меток"""
+        return self.values.get(self._key(labels), 0)
+    
+    def samples(self) -> list:
+        """Строки значений для вывода в формате Prometheus"""
+        return [f"{self.name}{_labels(key)} {value}" for key, value in self.values.items()]
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+    
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        # Ключ меток -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self.values = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+    
+    def get(self, **labels):
+        """Количество наблюдений для набора меток"""
+        state = self.values.get(self._key(labels))
+        return state[2] if state is not None else 0
+    
+    def samples(self) -> list:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+def _register(cls, name: str, help_text: str, **kwargs):
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = cls(name, help_text, **kwargs)
+    return metric
+
+def counter(name: str, help_text: str) -> Counter:
+    """Получить (или создать) счетчик"""
+    return _register(Counter, name, help_text)
+
+def gauge(name: str, help_text: str) -> Gauge:
+    """Получить (или создать) текущее значение"""
+    return _register(Gauge, name, help_text)
+
+def histogram(name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    """Получить (или создать) гистограмму"""
+    return _register(Histogram, name, help_text, buckets=buckets)
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus (для /metrics)"""
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PENDING = metrics.gauge('outbox_pending', 'Заявки в локальном журнале, еще не записанные в БД')
+OUTBOX_FLUSHED = metrics.counter('outbox_flushed_total', 'Заявки, записанные из журнала в БД')
+OUTBOX_FAILED = metrics.counter('outbox_failed_total', 'Заявки, отклоненные БД (остаются в журнале с failed=1)')
+OUTBOX_RETRIES = metrics.counter('outbox_retries_total', 'Повторные попытки записи пачки после ошибки')
+OUTBOX_NO_MASTER = metrics.counter('outbox_no_master_total', 'Заявки незарегистрированных мастеров, отложенные до регистрации')
+
+# Состояние заявки в журнале (колонка failed): ждет записи, отклонена БД, ждет регистрации мастера
+PENDING, REJECTED, NO_MASTER = 0, 1, 2
+
+def is_permanent_error(error: APIError) -> bool:
+    """Ошибка данных (повтор не поможет), а не сбой сети или БД"""
+    code = error.code or ''
+    return code.startswith(('22', '23', '42', 'PGRST1', 'PGRST2'))
+
+class RequestOutbox:
+    """Локальный журнал заявок (SQLite): заявка сначала пишется сюда, затем фоновая задача пачками переносит ее в БД"""
+
+    def __init__(self, database, path: str, batch_size: int, flush_interval: float, max_backoff: float):
+        self.db = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' idempotency_key TEXT PRIMARY KEY,'
+            ' payload TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' failed INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Подписчики на действительно созданные строки requests (уведомления и т.п.)
+        self.listeners = []
+        # Мастер мог зарегистрироваться, пока процесс не работал: отложенные заявки пробуем еще раз
+        self._release()
+        OUTBOX_PENDING.set(self.pending())
+
+    def pending(self) -> int:
+        """Сколько заявок ждут записи в БД"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox WHERE failed = 0').fetchone()[0]
+
+    def _insert(self, rows: list) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.executemany(
+                'INSERT OR IGNORE INTO outbox (idempotency_key, payload, created_at) VALUES (?, ?, ?)',
+                [(row['idempotency_key'], json.dumps(row, ensure_ascii=False), now) for row in rows]
+            )
+            # Повторы по idempotency_key пропущены и в счет не идут
+            return cursor.rowcount
+
+    def _fetch(self) -> list:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT idempotency_key, payload FROM outbox WHERE failed = 0 ORDER BY created_at LIMIT ?',
+                (self.batch_size,)
+            ).fetchall()
+
+    def _delete(self, keys: list):
+        with self._lock:
+            self._conn.executemany('DELETE FROM outbox WHERE idempotency_key = ?', [(key,) for key in keys])
+
+    def _mark(self, keys: list, failed: int = PENDING):
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE outbox SET attempts = attempts + 1, failed = ? WHERE idempotency_key = ?',
+                [(failed, key) for key in keys]
+            )
+
+    def _release(self, telegram_id: int = None) -> int:
+        with self._lock:
+            if telegram_id is None:
+                cursor = self._conn.execute('UPDATE outbox SET failed = ? WHERE failed = ?', (PENDING, NO_MASTER))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE outbox SET failed = ? WHERE failed = ? AND json_extract(payload, '$.telegram_id') = ?",
+                    (PENDING, NO_MASTER, telegram_id)
+                )
+            return cursor.rowcount
+
+    def _publish(self, created: list):
+        for listener in self.listeners:
+            try:
+                listener(created)
+            except Exception as e:
+                logger.error("Outbox listener failed: %s", e)
+
+    async def enqueue(self, rows: list):
+        """Надежно сохранить заявки локально; запись в БД произойдет в фоне"""
+        inserted = await asyncio.to_thread(self._insert, rows)
+        OUTBOX_PENDING.inc(inserted)
+        self._wakeup.set()
+
+    async def release_master(self, telegram_id: int):
+        """Мастер зарегистрировался: вернуть его отложенные заявки в очередь записи"""
+        released = await asyncio.to_thread(self._release, telegram_id)
+        if released:
+            logger.info("Released %s requests of newly registered user %s", released, telegram_id)
+            OUTBOX_PENDING.inc(released)
+            self._wakeup.set()
+
+    async def drain(self) -> int:
+        """Перенести одну пачку заявок в БД, вернуть размер пачки"""
+        batch = await asyncio.to_thread(self._fetch)
+        if not batch:
+            return 0
+
+        keys = [key for key, _ in batch]
+        rows = [json.loads(payload) for _, payload in batch]
+        keys, rows = await self._resolve_masters(keys, rows)
+        if not rows:
+            return len(batch)
+        try:
+            response = await self.db.create_requests(rows)
+        except APIError as e:
+            if not is_permanent_error(e):
+                await asyncio.to_thread(self._mark, keys)
+                raise
+            if len(rows) == 1:
+                # Заявку БД не примет никогда: оставляем в журнале для разбора, но больше не шлем
+                logger.error("Request %s rejected by database: %s", keys[0], e.message)
+                await asyncio.to_thread(self._mark, keys, REJECTED)
+                OUTBOX_FAILED.inc()
+                OUTBOX_PENDING.dec()
+                return len(batch)
+            # Ищем испорченную заявку, отправляя пачку по одной
+            for key, row in zip(keys, rows):
+                await self._drain_one(key, row)
+            return len(batch)
+
+        await asyncio.to_thread(self._delete, keys)
+        OUTBOX_FLUSHED.inc(len(rows))
+        OUTBOX_PENDING.dec(len(rows))
+        # Повторы по idempotency_key БД не возвращает: подписчики видят только новые строки
+        self._publish(response.data)
+        return len(batch)
+
+    async def _resolve_masters(self, keys: list, rows: list) -> tuple[list, list]:
+        """Подставить master_id по telegram_id мастера; заявки незарегистрированных отложить до регистрации"""
+        telegram_ids = list({row['telegram_id'] for row in rows if 'telegram_id' in row})
+        if not telegram_ids:
+            return keys, rows
+        master_ids = await self.db.get_user_ids(telegram_ids)
+
+        resolved_keys, resolved_rows, unknown = [], [], []
+        for key, row in zip(keys, rows):
+            if 'telegram_id' in row:
+                master_id = master_ids.get(row['telegram_id'])
+                if master_id is None:
+                    unknown.append(key)
+                    continue
+                row = {**{name: value for name, value in row.items() if name != 'telegram_id'}, 'master_id': master_id}
+            resolved_keys.append(key)
+            resolved_rows.append(row)
+
+        if unknown:
+            logger.error("Requests %s have no registered master, held in outbox until registration", unknown)
+            await asyncio.to_thread(self._mark, unknown, NO_MASTER)
+            OUTBOX_NO_MASTER.inc(len(unknown))
+            OUTBOX_PENDING.dec(len(unknown))
+        return resolved_keys, resolved_rows
+
+    async def _drain_one(self, key: str, row: dict):
+        try:
+            response = await self.db.create_requests([row])
+        except APIError as e:
+            if not is_permanent_error(e):
+                raise
+            logger.error("Request %s rejected by database: %s", key, e.message)
+            await asyncio.to_thread(self._mark, [key], REJECTED)
+            OUTBOX_FAILED.inc()
+        else:
+            await asyncio.to_thread(self._delete, [key])
+            OUTBOX_FLUSHED.inc()
+            self._publish(response.data)
+        OUTBOX_PENDING.dec()
+
+    async def _run(self):
+        backoff = 0
+        while True:
+            if backoff:
+                await asyncio.sleep(backoff)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval * 10)
+                except asyncio.TimeoutError:
+                    pass
+                # Небольшое окно, чтобы собрать всплеск заявок в одну пачку
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while await self.drain() == self.batch_size:
+                    pass
+                backoff = 0
+            except Exception as e:
+                OUTBOX_RETRIES.inc()
+                backoff = min(max(backoff * 2, 1), self.max_backoff)
+                logger.warning("Outbox flush failed, retrying in %ss: %s", backoff, e)
+
+    def start_background(self):
+        """Запустить фоновую запись заявок в БД"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую запись, попытаться дописать остаток и закрыть журнал"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            while await self.drain():
+                pass
+        except Exception as e:
+            logger.warning("Outbox left %s requests for next start: %s", self.pending(), e)
+        self._conn.close()
@@ -0,0 +1,141 @@
+"""
+ВЫГРУЗКА ЗАЯВОК ЗА ПЕРИОД В CSV/XLSX: ПОРЦИИ ИЗ БД СРАЗУ ПИШУТСЯ В ФАЙЛ, В ПАМЯТИ - НЕ БОЛЬШЕ ОДНОЙ ПОРЦИИ
+"""
+import asyncio
+import csv
+import importlib.util
+import os
+import tempfile
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import metrics
+from config.matrix import PRODUCTS, REQUEST_STATUSES, TRANSFORMER_TYPES, WORKSHOPS
+
+EXPORT_ROWS = metrics.counter('export_rows_total', 'Строки заявок, выгруженные в отчеты')
+
+EXPORT_HEADERS = (
+    'Создана',
+    'Изменена',
+    'Тип трансформатора',
+    'Участок',
+    'Изделие',
+    'Чертеж',
+    'Номер изделия',
+    'Статус',
+    'Мастер',
+    'Контролер'
+)
+
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+def xlsx_available() -> bool:
+    """Установлен ли openpyxl (XLSX - по желанию, CSV работает всегда)"""
+    return importlib.util.find_spec('openpyxl') is not None
+
+def parse_period(value: str, timezone: str) -> tuple[datetime, datetime]:
+    """Период отчета: 'ГГГГ-ММ' - месяц, 'ГГГГ-ММ-ДД' - сутки (смена), пусто - текущий месяц"""
+    tz = ZoneInfo(timezone)
+    if not value:
+        start = datetime.now(tz).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif len(value) == 7:
+        start = datetime.strptime(value, '%Y-%m').replace(tzinfo=tz)
+    else:
+        start = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=tz)
+        return start, start + timedelta(days=1)
+    # Первое число следующего месяца
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+def local_time(value: str, tz: ZoneInfo) -> str:
+    """Метка времени из БД в часовом поясе отчета"""
+    if not value:
+        return ''
+    return datetime.fromisoformat(value).astimezone(tz).strftime('%Y-%m-%d %H:%M:%S')
+
+def export_row(row: dict, tz: ZoneInfo) -> list:
+    """Строка отчета с названиями вместо ключей справочников"""
+    return [
+        local_time(row['created_at'], tz),
+        local_time(row['updated_at'], tz),
+        TRANSFORMER_TYPES.get(row['transformer_type'], row['transformer_type']),
+        WORKSHOPS.get(row['workshop'], row['workshop']),
+        PRODUCTS.get(row['product_type'], row['product_type']),
+        row['drawing_number'],
+        row['product_number'] or '',
+        REQUEST_STATUSES.get(row['status'], row['status']),
+        row['master_name'] or '',
+        row['inspector_name'] or ''
+    ]
+
+class CsvReport:
+    """CSV для Excel: UTF-8 с BOM и разделитель ';'"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file, delimiter=';')
+        self._writer.writerow(EXPORT_HEADERS)
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+class XlsxReport:
+    """XLSX в потоковом режиме openpyxl (строки сразу уходят во временный файл книги)"""
+
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet('Заявки')
+        self._sheet.append(EXPORT_HEADERS)
+
+    def write(self, rows: list):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self._path)
+
+REPORTS = {'csv': CsvReport, 'xlsx': XlsxReport}
+
+async def iter_requests(database, date_from: datetime, date_to: datetime, workshop: str = None,
+                        status: str = None, chunk_size: int = 1000):
+    """Заявки за период порциями по chunk_size строк"""
+    cursor = None
+    while True:
+        rows = (await database.export_requests_page(
+            date_from.isoformat(), date_to.isoformat(), workshop, status, cursor, chunk_size
+        )).data
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+async def export_requests(database, fmt: str, date_from: datetime, date_to: datetime, workshop: str = None,
+                          status: str = None, chunk_size: int = 1000, directory: str = None) -> tuple[str, int]:
+    """Выгрузить заявки во временный файл; вернуть (путь, число строк). Файл удаляет вызывающий"""
+    fd, path = tempfile.mkstemp(prefix='requests-', suffix=f'.{fmt}', dir=directory)
+    os.close(fd)
+    count = 0
+    try:
+        report = await asyncio.to_thread(REPORTS[fmt], path)
+        try:
+            async for rows in iter_requests(database, date_from, date_to, workshop, status, chunk_size):
+                # Запись порции - в потоке, чтобы не держать event loop
+                await asyncio.to_thread(report.write, [export_row(row, date_from.tzinfo) for row in rows])
+                count += len(rows)
+                EXPORT_ROWS.inc(len(rows))
+        finally:
+            await asyncio.to_thread(report.close)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
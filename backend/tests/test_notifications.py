@@ -0,0 +1,87 @@
+"""
+УВЕДОМЛЕНИЯ: ПАУЗА МЕЖДУ СООБЩЕНИЯМИ В ОДИН ЧАТ НЕ ЗАДЕРЖИВАЕТ ДРУГИЕ ЧАТЫ, ПРИ ОСТАНОВКЕ СВОДКИ ДОСЫЛАЮТСЯ
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.notifications import Notifier
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+class Database:
+    """Контролеры участка winding - чаты 1 и 2"""
+
+    async def get_inspectors(self, workshop: str):
+        return Response([{'telegram_id': 1}, {'telegram_id': 2}])
+
+class Bot:
+    """Запоминает, в какой чат и когда ушло сообщение"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent.append((chat_id, text, time.monotonic()))
+
+def make_notifier(bot, chat_interval: float = 0.5, digest_window: float = 60) -> Notifier:
+    return Notifier(bot, Database(), global_rate=100, chat_interval=chat_interval,
+                    digest_window=digest_window, inspectors_ttl=60)
+
+def test_chat_interval_does_not_block_other_chats():
+    async def scenario():
+        bot = Bot()
+        notifier = make_notifier(bot)
+        notifier.start_background()
+        started = time.monotonic()
+        notifier.send(1, 'first')
+        notifier.send(1, 'second')
+        notifier.send(2, 'other')
+        await notifier.flush(timeout=5)
+        await notifier.stop()
+        return bot.sent, started
+
+    sent, started = asyncio.run(scenario())
+    delays = {text: at - started for _, text, at in sent}
+    assert [text for _, text, _ in sent] == ['first', 'other', 'second']
+    assert delays['other'] < 0.1
+    assert delays['second'] >= 0.5
+
+def test_flush_sends_pending_digests():
+    async def scenario():
+        bot = Bot()
+        notifier = make_notifier(bot)
+        notifier.start_background()
+        notifier.notify_new_requests([
+            {'workshop': 'winding', 'product_type': 'lv_winding', 'drawing_number': 'A-1', 'product_number': '1'}
+        ])
+        # Окно сводки не дождались: остановка должна разослать ее сразу
+        await notifier.flush(timeout=5)
+        await notifier.stop()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    assert sorted(chat_id for chat_id, _, _ in sent) == [1, 2]
+    assert all('A-1' in text for _, text, _ in sent)
+
+def test_flush_gives_up_after_timeout():
+    async def scenario():
+        bot = Bot()
+        notifier = make_notifier(bot, chat_interval=60)
+        notifier.start_background()
+        notifier.send(1, 'first')
+        notifier.send(1, 'second')
+        started = time.monotonic()
+        await notifier.flush(timeout=0.2)
+        elapsed = time.monotonic() - started
+        await notifier.stop()
+        return bot.sent, elapsed
+
+    sent, elapsed = asyncio.run(scenario())
+    assert [text for _, text, _ in sent] == ['first']
+    assert elapsed < 1
@@ -0,0 +1,75 @@
+"""
+ЖУРНАЛ ЗАЯВОК: ЗАЯВКИ НЕЗАРЕГИСТРИРОВАННОГО МАСТЕРА ЖДУТ РЕГИСТРАЦИИ, А НЕ ТЕРЯЮТСЯ
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbox import RequestOutbox
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+class Database:
+    """users и requests в памяти"""
+
+    def __init__(self):
+        self.users = {}
+        self.requests = []
+
+    async def get_user_ids(self, telegram_ids: list) -> dict:
+        return {telegram_id: self.users[telegram_id] for telegram_id in telegram_ids if telegram_id in self.users}
+
+    async def create_requests(self, rows: list):
+        self.requests.extend(rows)
+        return Response(rows)
+
+def make_request(telegram_id: int, key: str) -> dict:
+    return {'telegram_id': telegram_id, 'drawing_number': 'A-1', 'idempotency_key': key}
+
+def test_request_of_unregistered_master_is_released_after_registration():
+    async def scenario(path):
+        database = Database()
+        outbox = RequestOutbox(database, path, batch_size=10, flush_interval=1, max_backoff=1)
+        await outbox.enqueue([make_request(7, 'a'), make_request(8, 'b')])
+        database.users[8] = 80
+        await outbox.drain()
+        held = outbox.pending()
+
+        database.users[7] = 70
+        await outbox.release_master(7)
+        released = outbox.pending()
+        await outbox.drain()
+        await outbox.stop()
+        return database.requests, held, released
+
+    with tempfile.TemporaryDirectory() as directory:
+        requests, held, released = asyncio.run(scenario(os.path.join(directory, 'outbox.sqlite3')))
+    assert held == 0
+    assert released == 1
+    assert sorted(row['master_id'] for row in requests) == [70, 80]
+    assert all('telegram_id' not in row for row in requests)
+
+def test_held_requests_are_retried_on_restart():
+    async def scenario(path):
+        database = Database()
+        outbox = RequestOutbox(database, path, batch_size=10, flush_interval=1, max_backoff=1)
+        await outbox.enqueue([make_request(7, 'a')])
+        await outbox.drain()
+        await outbox.stop()
+
+        database.users[7] = 70
+        restarted = RequestOutbox(database, path, batch_size=10, flush_interval=1, max_backoff=1)
+        pending = restarted.pending()
+        await restarted.drain()
+        await restarted.stop()
+        return database.requests, pending
+
+    with tempfile.TemporaryDirectory() as directory:
+        requests, pending = asyncio.run(scenario(os.path.join(directory, 'outbox.sqlite3')))
+    assert pending == 1
+    assert [row['master_id'] for row in requests] == [70]
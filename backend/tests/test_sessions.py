@@ -0,0 +1,70 @@
+"""
+СЕССИИ: ЗАВЕРШЕНИЕ ВО ВРЕМЯ ОТЛОЖЕННОЙ ЗАПИСИ НЕ ДОЛЖНО ОСТАВЛЯТЬ СТРОКУ В REQUEST_SESSIONS
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.sessions import SessionStore
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+class SlowDatabase:
+    """request_sessions в памяти; запись идет с задержкой, чтобы finish успел вклиниться"""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def save_sessions(self, rows: list):
+        await asyncio.sleep(0.05)
+        for row in rows:
+            self.rows[row['telegram_id']] = row
+        return Response([])
+
+    async def delete_sessions(self, telegram_ids: list):
+        for telegram_id in telegram_ids:
+            self.rows.pop(telegram_id, None)
+        return Response([])
+
+    async def get_sessions(self):
+        return Response(list(self.rows.values()))
+
+def make_store(database) -> SessionStore:
+    return SessionStore(database, ttl=3600, max_size=100, flush_interval=1, max_age=3600, sweep_interval=600)
+
+def test_finish_during_flush_does_not_resurrect_session():
+    async def scenario():
+        database = SlowDatabase()
+        store = make_store(database)
+        store.start(7, current_step='entering_product_number', transformer_type='TMG')
+        flush = asyncio.create_task(store.flush())
+        await asyncio.sleep(0.01)
+        # Заявка оформлена, пока сессия записывается
+        store.finish(7)
+        await flush
+
+        restarted = make_store(database)
+        await restarted.load()
+        return database.rows, restarted.get(7)
+
+    rows, restored = asyncio.run(scenario())
+    assert rows == {}
+    assert restored is None
+
+def test_new_session_after_finish_is_kept():
+    async def scenario():
+        database = SlowDatabase()
+        store = make_store(database)
+        store.start(7, current_step='selecting_product')
+        await store.flush()
+        store.finish(7)
+        session = store.start(7, current_step='selecting_transformer')
+        await store.flush()
+        return database.rows, session
+
+    rows, session = asyncio.run(scenario())
+    assert rows[7]['id'] == session['id']
@@ -5,7 +5,8 @@ CREATE TABLE IF NOT EXISTS users (
     username TEXT,
     full_name TEXT,
     workshop TEXT NOT NULL,
-    role TEXT DEFAULT 'master',
+    -- master - мастер участка, inspector - контролер ОТК (получает новые заявки своего участка), admin
+    role TEXT DEFAULT 'master' CHECK (role IN ('master', 'inspector', 'admin')),
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -19,10 +20,14 @@ CREATE TABLE IF NOT EXISTS requests (
     product_type TEXT NOT NULL,
     drawing_number TEXT NOT NULL,
     product_number TEXT,
-    status TEXT DEFAULT 'planned',
+    -- planned -> in_progress (взята контролером) -> success / rejected
+    status TEXT NOT NULL DEFAULT 'planned' CHECK (status IN ('planned', 'in_progress', 'success', 'rejected')),
+    -- Ключ идемпотентности (id сессии мастера): повторная отправка той же заявки не создает дубликат
+    idempotency_key UUID UNIQUE,
     
     -- Связи
     master_id UUID REFERENCES users(id),
+    inspector_id UUID REFERENCES users(id),
     
     -- Метаданные
     created_at TIMESTAMPTZ DEFAULT NOW(),
@@ -30,24 +35,57 @@ CREATE TABLE IF NOT EXISTS requests (
 );
 
 -- Таблица для хранения состояний создания заявок
+-- Одна строка на пользователя: telegram_id - ключ конфликта для upsert
 CREATE TABLE IF NOT EXISTS request_sessions (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-    telegram_id BIGINT NOT NULL,
+    telegram_id BIGINT UNIQUE NOT NULL,
     transformer_type TEXT,
     workshop TEXT,
     product_type TEXT,
     drawing_number TEXT,
     product_number TEXT,
     current_step TEXT,
+    -- Черновик несоответствия: заявка, описание и ссылки на фото
+    request_id UUID,
+    description TEXT,
+    photos JSONB,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Несоответствия, найденные при приемке
+-- id - id сессии контролера (повторная отправка не создает дубликат)
+-- photos: [{"file_id", "file_unique_id", "thumb_file_id"}] - ссылки на файлы Telegram, без самих файлов
+CREATE TABLE IF NOT EXISTS nonconformances (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    request_id UUID NOT NULL REFERENCES requests(id) ON DELETE CASCADE,
+    author_id UUID REFERENCES users(id),
+    description TEXT NOT NULL,
+    photos JSONB NOT NULL DEFAULT '[]',
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Сводка заявок по участку, изделию и статусу (ведется триггером на requests)
+CREATE TABLE IF NOT EXISTS request_stats (
+    workshop TEXT NOT NULL,
+    product_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (workshop, product_type, status)
+);
+
 -- Индексы для быстрого поиска
 CREATE INDEX IF NOT EXISTS idx_users_telegram ON users(telegram_id);
-CREATE INDEX IF NOT EXISTS idx_requests_master ON requests(master_id);
+CREATE INDEX IF NOT EXISTS idx_users_role_workshop ON users(role, workshop);
+CREATE INDEX IF NOT EXISTS idx_requests_master_created ON requests(master_id, created_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_requests_workshop ON requests(workshop);
-CREATE INDEX IF NOT EXISTS idx_requests_status ON requests(status);
-CREATE INDEX IF NOT EXISTS idx_sessions_telegram ON request_sessions(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_requests_created ON requests(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_requests_drawings ON requests(transformer_type, workshop, product_type, drawing_number);
+-- Частичные индексы: очередь участка и заявки в работе у контролера
+CREATE INDEX IF NOT EXISTS idx_requests_queue ON requests(workshop, created_at, id) WHERE status = 'planned';
+CREATE INDEX IF NOT EXISTS idx_requests_inspector_active ON requests(inspector_id, created_at, id) WHERE status = 'in_progress';
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON request_sessions(updated_at);
+CREATE INDEX IF NOT EXISTS idx_nonconformances_request ON nonconformances(request_id, created_at DESC);
 
 -- Функция для обновления updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -58,6 +96,221 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Очистка брошенных сессий (вызывается ботом по расписанию)
+CREATE OR REPLACE FUNCTION purge_stale_sessions(max_age_seconds INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    deleted INTEGER;
+BEGIN
+    DELETE FROM request_sessions WHERE updated_at < NOW() - make_interval(secs => max_age_seconds);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ language 'plpgsql';
+
+-- Заявки мастера по telegram_id одним вызовом, постранично (keyset по (created_at, id))
+-- p_direction: 'older' - страница до курсора, 'newer' - страница после курсора
+CREATE OR REPLACE FUNCTION get_master_requests(
+    p_telegram_id BIGINT,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_direction TEXT DEFAULT 'older',
+    p_limit INTEGER DEFAULT 5
+)
+RETURNS SETOF requests AS $$
+DECLARE
+    v_master_id UUID;
+BEGIN
+    SELECT id INTO v_master_id FROM users WHERE telegram_id = p_telegram_id;
+    IF v_master_id IS NULL THEN
+        RETURN;
+    END IF;
+    
+    IF p_cursor_created_at IS NULL THEN
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE master_id = v_master_id
+            ORDER BY created_at DESC, id DESC
+            LIMIT p_limit;
+    ELSIF p_direction = 'newer' THEN
+        RETURN QUERY
+            SELECT * FROM (
+                SELECT * FROM requests
+                WHERE master_id = v_master_id AND (created_at, id) > (p_cursor_created_at, p_cursor_id)
+                ORDER BY created_at, id
+                LIMIT p_limit
+            ) page
+            ORDER BY created_at DESC, id DESC;
+    ELSE
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE master_id = v_master_id AND (created_at, id) < (p_cursor_created_at, p_cursor_id)
+            ORDER BY created_at DESC, id DESC
+            LIMIT p_limit;
+    END IF;
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Очередь контролера: заявки участка со статусом 'planned' от старых к новым (keyset по (created_at, id))
+CREATE OR REPLACE FUNCTION get_inspector_queue(
+    p_workshop TEXT,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 10
+)
+RETURNS SETOF requests AS $$
+BEGIN
+    IF p_cursor_created_at IS NULL THEN
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE workshop = p_workshop AND status = 'planned'
+            ORDER BY created_at, id
+            LIMIT p_limit;
+    ELSE
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE workshop = p_workshop AND status = 'planned'
+              AND (created_at, id) > (p_cursor_created_at, p_cursor_id)
+            ORDER BY created_at, id
+            LIMIT p_limit;
+    END IF;
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Смена статуса заявки контролером: claim (planned -> in_progress), accept/reject (in_progress -> success/rejected)
+-- Условный UPDATE по текущему статусу: из двух одновременных попыток проходит одна, вторая получает пустой ответ
+CREATE OR REPLACE FUNCTION transition_request(
+    p_request_id UUID,
+    p_telegram_id BIGINT,
+    p_action TEXT
+)
+RETURNS TABLE (
+    id UUID,
+    workshop TEXT,
+    product_type TEXT,
+    drawing_number TEXT,
+    product_number TEXT,
+    status TEXT,
+    master_telegram_id BIGINT
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_inspector users%ROWTYPE;
+    v_from TEXT;
+    v_to TEXT;
+BEGIN
+    SELECT * INTO v_inspector FROM users u
+    WHERE u.telegram_id = p_telegram_id AND u.role IN ('inspector', 'admin');
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    
+    CASE p_action
+        WHEN 'claim' THEN v_from := 'planned'; v_to := 'in_progress';
+        WHEN 'accept' THEN v_from := 'in_progress'; v_to := 'success';
+        WHEN 'reject' THEN v_from := 'in_progress'; v_to := 'rejected';
+        ELSE RAISE EXCEPTION 'Unknown action %', p_action USING ERRCODE = '22023';
+    END CASE;
+    
+    RETURN QUERY
+        UPDATE requests r
+        SET status = v_to, inspector_id = v_inspector.id
+        FROM users m
+        WHERE r.id = p_request_id
+          AND r.status = v_from
+          AND m.id = r.master_id
+          -- Взять можно только заявку своего участка, закрыть - только взятую собой
+          AND (v_inspector.role = 'admin' OR r.workshop = v_inspector.workshop)
+          AND (v_from = 'planned' OR r.inspector_id = v_inspector.id)
+        RETURNING r.id, r.workshop, r.product_type, r.drawing_number, r.product_number, r.status, m.telegram_id;
+END;
+$$ language 'plpgsql';
+
+-- Выгрузка заявок за период порциями (keyset по (created_at, id)) с именами мастера и контролера
+CREATE OR REPLACE FUNCTION export_requests(
+    p_from TIMESTAMPTZ,
+    p_to TIMESTAMPTZ,
+    p_workshop TEXT DEFAULT NULL,
+    p_status TEXT DEFAULT NULL,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    transformer_type TEXT,
+    workshop TEXT,
+    product_type TEXT,
+    drawing_number TEXT,
+    product_number TEXT,
+    status TEXT,
+    master_name TEXT,
+    inspector_name TEXT
+) AS $$
+BEGIN
+    -- Курсор - условие индекса, а не фильтр: каждая порция читает только свои строки
+    RETURN QUERY
+        SELECT r.id, r.created_at, r.updated_at, r.transformer_type, r.workshop, r.product_type,
+               r.drawing_number, r.product_number, r.status, m.full_name, i.full_name
+        FROM requests r
+        LEFT JOIN users m ON m.id = r.master_id
+        LEFT JOIN users i ON i.id = r.inspector_id
+        WHERE (r.created_at, r.id) > (
+                  COALESCE(p_cursor_created_at, p_from),
+                  COALESCE(p_cursor_id, '00000000-0000-0000-0000-000000000000'::UUID)
+              )
+          AND r.created_at >= p_from
+          AND r.created_at < p_to
+          AND (p_workshop IS NULL OR r.workshop = p_workshop)
+          AND (p_status IS NULL OR r.status = p_status)
+        ORDER BY r.created_at, r.id
+        LIMIT p_limit;
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Различные номера чертежей для сочетания тип/участок/изделие (подсказки при вводе), порциями после p_after
+CREATE OR REPLACE FUNCTION get_drawing_numbers(
+    p_transformer_type TEXT,
+    p_workshop TEXT,
+    p_product_type TEXT,
+    p_after TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (drawing_number TEXT) AS $$
+    SELECT DISTINCT r.drawing_number FROM requests r
+    WHERE r.transformer_type = p_transformer_type
+      AND r.workshop = p_workshop
+      AND r.product_type = p_product_type
+      AND (p_after IS NULL OR r.drawing_number > p_after)
+    ORDER BY r.drawing_number
+    LIMIT p_limit;
+$$ language 'sql' STABLE;
+
+-- Функция для инкрементального обновления request_stats
+CREATE OR REPLACE FUNCTION update_request_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE request_stats SET total = total - 1
+        WHERE workshop = OLD.workshop
+          AND product_type = OLD.product_type
+          AND status = COALESCE(OLD.status, 'planned');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO request_stats (workshop, product_type, status, total)
+        VALUES (NEW.workshop, NEW.product_type, COALESCE(NEW.status, 'planned'), 1)
+        ON CONFLICT (workshop, product_type, status) DO UPDATE SET total = request_stats.total + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
 -- Триггеры для автоматического обновления updated_at
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_requests_updated_at BEFORE UPDATE ON requests FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+CREATE TRIGGER update_request_sessions_updated_at BEFORE UPDATE ON request_sessions FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Триггер для сводки request_stats
+CREATE TRIGGER update_request_stats_counts AFTER INSERT OR DELETE OR UPDATE OF workshop, product_type, status ON requests FOR EACH ROW EXECUTE FUNCTION update_request_stats();
\ No newline at end of file
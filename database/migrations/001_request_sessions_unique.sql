@@ -0,0 +1,41 @@
+-- Миграция: одна сессия на пользователя в request_sessions
+-- Раньше upsert без ключа конфликта добавлял новую строку на каждом шаге мастера.
+
+BEGIN;
+
+ALTER TABLE request_sessions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+-- DEFAULT NOW() проставил всем строкам время миграции: возраст старых сессий считаем от создания
+-- (триггер снимаем заранее, иначе он снова запишет NOW())
+DROP TRIGGER IF EXISTS update_request_sessions_updated_at ON request_sessions;
+UPDATE request_sessions SET updated_at = COALESCE(created_at, updated_at);
+
+-- Оставляем только самую свежую строку каждого пользователя
+DELETE FROM request_sessions s
+USING (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY telegram_id ORDER BY created_at DESC, id DESC) AS rn
+    FROM request_sessions
+) ranked
+WHERE s.id = ranked.id AND ranked.rn > 1;
+
+DROP INDEX IF EXISTS idx_sessions_telegram;
+ALTER TABLE request_sessions ADD CONSTRAINT request_sessions_telegram_id_key UNIQUE (telegram_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON request_sessions(updated_at);
+
+CREATE TRIGGER update_request_sessions_updated_at BEFORE UPDATE ON request_sessions FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Очистка брошенных сессий (вызывается ботом по расписанию)
+CREATE OR REPLACE FUNCTION purge_stale_sessions(max_age_seconds INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    deleted INTEGER;
+BEGIN
+    DELETE FROM request_sessions WHERE updated_at < NOW() - make_interval(secs => max_age_seconds);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ language 'plpgsql';
+
+COMMIT;
+
+-- Освобождаем место после удаления дубликатов (вне транзакции)
+VACUUM (ANALYZE) request_sessions;
@@ -0,0 +1,13 @@
+-- Миграция: users.workshop хранит ключ участка (как requests.workshop), а не название кнопки
+
+UPDATE users SET workshop = CASE workshop
+    WHEN 'Намотки' THEN 'winding'
+    WHEN 'Покраски' THEN 'painting'
+    WHEN 'Сборки' THEN 'assembly'
+    WHEN 'ППП' THEN 'testing'
+    WHEN 'Металлоконструкций' THEN 'metal'
+    WHEN 'Станки с ЧПУ' THEN 'cnc'
+    WHEN 'Площадка Вишнёвая' THEN 'vishnya'
+    WHEN 'Сборки кожухов' THEN 'housing'
+    ELSE workshop
+END;
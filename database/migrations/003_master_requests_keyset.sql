@@ -0,0 +1,47 @@
+-- Миграция: "Мои заявки" одним вызовом с keyset-пагинацией
+
+DROP INDEX IF EXISTS idx_requests_master;
+CREATE INDEX IF NOT EXISTS idx_requests_master_created ON requests(master_id, created_at DESC, id DESC);
+
+-- Заявки мастера по telegram_id одним вызовом, постранично (keyset по (created_at, id))
+-- p_direction: 'older' - страница до курсора, 'newer' - страница после курсора
+CREATE OR REPLACE FUNCTION get_master_requests(
+    p_telegram_id BIGINT,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_direction TEXT DEFAULT 'older',
+    p_limit INTEGER DEFAULT 5
+)
+RETURNS SETOF requests AS $$
+DECLARE
+    v_master_id UUID;
+BEGIN
+    SELECT id INTO v_master_id FROM users WHERE telegram_id = p_telegram_id;
+    IF v_master_id IS NULL THEN
+        RETURN;
+    END IF;
+    
+    IF p_cursor_created_at IS NULL THEN
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE master_id = v_master_id
+            ORDER BY created_at DESC, id DESC
+            LIMIT p_limit;
+    ELSIF p_direction = 'newer' THEN
+        RETURN QUERY
+            SELECT * FROM (
+                SELECT * FROM requests
+                WHERE master_id = v_master_id AND (created_at, id) > (p_cursor_created_at, p_cursor_id)
+                ORDER BY created_at, id
+                LIMIT p_limit
+            ) page
+            ORDER BY created_at DESC, id DESC;
+    ELSE
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE master_id = v_master_id AND (created_at, id) < (p_cursor_created_at, p_cursor_id)
+            ORDER BY created_at DESC, id DESC
+            LIMIT p_limit;
+    END IF;
+END;
+$$ language 'plpgsql' STABLE;
@@ -0,0 +1,46 @@
+-- Миграция: сводная таблица для "📊 Статистика"
+
+BEGIN;
+
+-- Новые заявки ждут, пока сводка заполняется и включается триггер
+LOCK TABLE requests IN SHARE ROW EXCLUSIVE MODE;
+
+-- Сводка заявок по участку, изделию и статусу (ведется триггером на requests)
+CREATE TABLE IF NOT EXISTS request_stats (
+    workshop TEXT NOT NULL,
+    product_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (workshop, product_type, status)
+);
+
+-- Заполняем сводку по уже созданным заявкам
+INSERT INTO request_stats (workshop, product_type, status, total)
+SELECT workshop, product_type, COALESCE(status, 'planned'), COUNT(*)
+FROM requests
+GROUP BY workshop, product_type, COALESCE(status, 'planned')
+ON CONFLICT (workshop, product_type, status) DO UPDATE SET total = EXCLUDED.total;
+
+-- Функция для инкрементального обновления request_stats
+CREATE OR REPLACE FUNCTION update_request_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE request_stats SET total = total - 1
+        WHERE workshop = OLD.workshop
+          AND product_type = OLD.product_type
+          AND status = COALESCE(OLD.status, 'planned');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO request_stats (workshop, product_type, status, total)
+        VALUES (NEW.workshop, NEW.product_type, COALESCE(NEW.status, 'planned'), 1)
+        ON CONFLICT (workshop, product_type, status) DO UPDATE SET total = request_stats.total + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS update_request_stats_counts ON requests;
+CREATE TRIGGER update_request_stats_counts AFTER INSERT OR DELETE OR UPDATE OF workshop, product_type, status ON requests FOR EACH ROW EXECUTE FUNCTION update_request_stats();
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- Миграция: ключ идемпотентности для записи заявок пачками из локального журнала бота
+
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS idempotency_key UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS requests_idempotency_key_key ON requests(idempotency_key);
@@ -0,0 +1,6 @@
+-- Миграция: роль контролера ОТК для рассылки новых заявок по участкам
+-- Назначение контролера: UPDATE users SET role = 'inspector', workshop = '<ключ участка>' WHERE telegram_id = ...;
+
+UPDATE users SET role = 'master' WHERE role IS NULL OR role NOT IN ('master', 'inspector', 'admin');
+ALTER TABLE users ADD CONSTRAINT users_role_check CHECK (role IN ('master', 'inspector', 'admin'));
+CREATE INDEX IF NOT EXISTS idx_users_role_workshop ON users(role, workshop);
@@ -0,0 +1,89 @@
+-- Миграция: очередь контролера ОТК и переходы статусов заявки
+-- Статусы: planned -> in_progress (взята контролером) -> success / rejected
+
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS inspector_id UUID REFERENCES users(id);
+UPDATE requests SET status = 'planned' WHERE status IS NULL;
+ALTER TABLE requests ALTER COLUMN status SET NOT NULL;
+-- NOT VALID: старые строки с другими статусами не проверяются, новые - да
+ALTER TABLE requests ADD CONSTRAINT requests_status_check
+    CHECK (status IN ('planned', 'in_progress', 'success', 'rejected')) NOT VALID;
+
+-- Частичные индексы: очередь участка и заявки в работе у контролера не читают закрытые заявки
+DROP INDEX IF EXISTS idx_requests_status;
+CREATE INDEX IF NOT EXISTS idx_requests_queue ON requests(workshop, created_at, id) WHERE status = 'planned';
+CREATE INDEX IF NOT EXISTS idx_requests_inspector_active ON requests(inspector_id, created_at, id) WHERE status = 'in_progress';
+
+-- Очередь контролера: заявки участка со статусом 'planned' от старых к новым (keyset по (created_at, id))
+CREATE OR REPLACE FUNCTION get_inspector_queue(
+    p_workshop TEXT,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 10
+)
+RETURNS SETOF requests AS $$
+BEGIN
+    IF p_cursor_created_at IS NULL THEN
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE workshop = p_workshop AND status = 'planned'
+            ORDER BY created_at, id
+            LIMIT p_limit;
+    ELSE
+        RETURN QUERY
+            SELECT * FROM requests
+            WHERE workshop = p_workshop AND status = 'planned'
+              AND (created_at, id) > (p_cursor_created_at, p_cursor_id)
+            ORDER BY created_at, id
+            LIMIT p_limit;
+    END IF;
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Смена статуса заявки контролером: claim (planned -> in_progress), accept/reject (in_progress -> success/rejected)
+-- Условный UPDATE по текущему статусу: из двух одновременных попыток проходит одна, вторая получает пустой ответ
+CREATE OR REPLACE FUNCTION transition_request(
+    p_request_id UUID,
+    p_telegram_id BIGINT,
+    p_action TEXT
+)
+RETURNS TABLE (
+    id UUID,
+    workshop TEXT,
+    product_type TEXT,
+    drawing_number TEXT,
+    product_number TEXT,
+    status TEXT,
+    master_telegram_id BIGINT
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_inspector users%ROWTYPE;
+    v_from TEXT;
+    v_to TEXT;
+BEGIN
+    SELECT * INTO v_inspector FROM users u
+    WHERE u.telegram_id = p_telegram_id AND u.role IN ('inspector', 'admin');
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    
+    CASE p_action
+        WHEN 'claim' THEN v_from := 'planned'; v_to := 'in_progress';
+        WHEN 'accept' THEN v_from := 'in_progress'; v_to := 'success';
+        WHEN 'reject' THEN v_from := 'in_progress'; v_to := 'rejected';
+        ELSE RAISE EXCEPTION 'Unknown action %', p_action USING ERRCODE = '22023';
+    END CASE;
+    
+    RETURN QUERY
+        UPDATE requests r
+        SET status = v_to, inspector_id = v_inspector.id
+        FROM users m
+        WHERE r.id = p_request_id
+          AND r.status = v_from
+          AND m.id = r.master_id
+          -- Взять можно только заявку своего участка, закрыть - только взятую собой
+          AND (v_inspector.role = 'admin' OR r.workshop = v_inspector.workshop)
+          AND (v_from = 'planned' OR r.inspector_id = v_inspector.id)
+        RETURNING r.id, r.workshop, r.product_type, r.drawing_number, r.product_number, r.status, m.telegram_id;
+END;
+$$ language 'plpgsql';
@@ -0,0 +1,19 @@
+-- Миграция: несоответствия по заявкам с фото (ссылки file_id Telegram)
+
+-- Черновик несоответствия хранится в сессии, как и черновик заявки
+ALTER TABLE request_sessions ADD COLUMN IF NOT EXISTS request_id UUID;
+ALTER TABLE request_sessions ADD COLUMN IF NOT EXISTS description TEXT;
+ALTER TABLE request_sessions ADD COLUMN IF NOT EXISTS photos JSONB;
+
+-- id - id сессии контролера (повторная отправка не создает дубликат)
+-- photos: [{"file_id", "file_unique_id", "thumb_file_id"}] - ссылки на файлы Telegram, без самих файлов
+CREATE TABLE IF NOT EXISTS nonconformances (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    request_id UUID NOT NULL REFERENCES requests(id) ON DELETE CASCADE,
+    author_id UUID REFERENCES users(id),
+    description TEXT NOT NULL,
+    photos JSONB NOT NULL DEFAULT '[]',
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_nonconformances_request ON nonconformances(request_id, created_at DESC);
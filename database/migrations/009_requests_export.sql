@@ -0,0 +1,47 @@
+-- Миграция: выгрузка заявок за период порциями
+
+CREATE INDEX IF NOT EXISTS idx_requests_created ON requests(created_at, id);
+
+-- Выгрузка заявок за период порциями (keyset по (created_at, id)) с именами мастера и контролера
+CREATE OR REPLACE FUNCTION export_requests(
+    p_from TIMESTAMPTZ,
+    p_to TIMESTAMPTZ,
+    p_workshop TEXT DEFAULT NULL,
+    p_status TEXT DEFAULT NULL,
+    p_cursor_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_cursor_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    transformer_type TEXT,
+    workshop TEXT,
+    product_type TEXT,
+    drawing_number TEXT,
+    product_number TEXT,
+    status TEXT,
+    master_name TEXT,
+    inspector_name TEXT
+) AS $$
+BEGIN
+    -- Курсор - условие индекса, а не фильтр: каждая порция читает только свои строки
+    RETURN QUERY
+        SELECT r.id, r.created_at, r.updated_at, r.transformer_type, r.workshop, r.product_type,
+               r.drawing_number, r.product_number, r.status, m.full_name, i.full_name
+        FROM requests r
+        LEFT JOIN users m ON m.id = r.master_id
+        LEFT JOIN users i ON i.id = r.inspector_id
+        WHERE (r.created_at, r.id) > (
+                  COALESCE(p_cursor_created_at, p_from),
+                  COALESCE(p_cursor_id, '00000000-0000-0000-0000-000000000000'::UUID)
+              )
+          AND r.created_at >= p_from
+          AND r.created_at < p_to
+          AND (p_workshop IS NULL OR r.workshop = p_workshop)
+          AND (p_status IS NULL OR r.status = p_status)
+        ORDER BY r.created_at, r.id
+        LIMIT p_limit;
+END;
+$$ language 'plpgsql' STABLE;
@@ -0,0 +1,21 @@
+-- Миграция: подсказки номеров чертежей
+
+CREATE INDEX IF NOT EXISTS idx_requests_drawings ON requests(transformer_type, workshop, product_type, drawing_number);
+
+-- Различные номера чертежей для сочетания тип/участок/изделие (подсказки при вводе), порциями после p_after
+CREATE OR REPLACE FUNCTION get_drawing_numbers(
+    p_transformer_type TEXT,
+    p_workshop TEXT,
+    p_product_type TEXT,
+    p_after TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (drawing_number TEXT) AS $$
+    SELECT DISTINCT r.drawing_number FROM requests r
+    WHERE r.transformer_type = p_transformer_type
+      AND r.workshop = p_workshop
+      AND r.product_type = p_product_type
+      AND (p_after IS NULL OR r.drawing_number > p_after)
+    ORDER BY r.drawing_number
+    LIMIT p_limit;
+$$ language 'sql' STABLE;